@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+F→Cマッピングを全体読み込みせずに参照する遅延 Mapping
+
+初回のオープン時に mji_analysis_f_to_c_mapping.json を1回走査し、各D列キーの
+値がファイル内のどこにあるか（バイトオフセットと長さ）を索引にして
+"<JSONファイル>.idx" に保存します。2回目以降は索引だけを読み、エントリは
+アクセスされた時にその範囲だけをデコードします。JSONのサイズか更新時刻が
+変わっていれば索引を作り直します。
+
+gzip / zstd で圧縮されたJSON（json_io の gzip・zstd プロファイル）は
+位置で読めないため、初回アクセス時に全体を読み込みます。
+"""
+import os
+import re
+import sys
+import json
+import mmap
+import pickle
+from array import array
+from collections.abc import Mapping
+
+from json_io import load_json
+from ivs_records import DEFAULT_F_TO_C_FILE
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_UNICODE_KEY = re.compile(r'U\+([0-9A-Fa-f]{4,6})')
+
+def _is_compressed(path):
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    return magic.startswith(b'\x1f\x8b') or magic.startswith(b'\x28\xb5\x2f\xfd')
+
+def build_index(json_file):
+    """トップレベルのオブジェクトを走査して (キー, バイトオフセット, 長さ) の索引を作る"""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    decoder = json.JSONDecoder()
+    keys = []
+    offsets = array('q')
+    lengths = array('q')
+
+    position = _WHITESPACE.match(text, 0).end()
+    if text[position:position + 1] != '{':
+        raise ValueError(f"{json_file} のトップレベルがオブジェクトではありません")
+    position = _WHITESPACE.match(text, position + 1).end()
+
+    # 文字位置からバイト位置への変換は直前の位置からの差分だけをエンコードする
+    char_position = 0
+    byte_position = 0
+
+    def to_bytes(target):
+        nonlocal char_position, byte_position
+        byte_position += len(text[char_position:target].encode('utf-8'))
+        char_position = target
+        return byte_position
+
+    if text[position:position + 1] == '}':
+        return keys, offsets, lengths
+
+    while True:
+        key, position = decoder.raw_decode(text, position)
+        position = _WHITESPACE.match(text, position).end()
+        if text[position:position + 1] != ':':
+            raise ValueError(f"{json_file} の {position} 文字目に ':' がありません")
+        value_start = _WHITESPACE.match(text, position + 1).end()
+        _, value_end = decoder.raw_decode(text, value_start)
+
+        start_byte = to_bytes(value_start)
+        keys.append(key)
+        offsets.append(start_byte)
+        lengths.append(to_bytes(value_end) - start_byte)
+
+        position = _WHITESPACE.match(text, value_end).end()
+        if text[position:position + 1] == ',':
+            position = _WHITESPACE.match(text, position + 1).end()
+        elif text[position:position + 1] == '}':
+            return keys, offsets, lengths
+        else:
+            raise ValueError(f"{json_file} の {position} 文字目が不正です")
+
+def _source_signature(json_file):
+    stat = os.stat(json_file)
+    return stat.st_size, stat.st_mtime_ns
+
+def load_index(json_file, index_file=None):
+    """保存済みの索引を読み込む（古い・壊れている場合は作り直して保存する）"""
+    if index_file is None:
+        index_file = json_file + INDEX_SUFFIX
+    signature = _source_signature(json_file)
+
+    try:
+        with open(index_file, 'rb') as f:
+            saved = pickle.load(f)
+        if saved.get("version") == INDEX_VERSION and saved.get("source") == signature:
+            return saved["keys"], saved["offsets"], saved["lengths"]
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+        pass
+
+    keys, offsets, lengths = build_index(json_file)
+    try:
+        with open(index_file, 'wb') as f:
+            pickle.dump({"version": INDEX_VERSION, "source": signature,
+                         "keys": keys, "offsets": offsets, "lengths": lengths},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        print(f"⚠ 索引を保存できませんでした: {index_file} - {e}")
+    return keys, offsets, lengths
+
+class LazyFToCMapping(Mapping):
+    """D列キーで引けるF→Cマッピングの読み取り専用ビュー
+
+    キーの一覧と位置だけを保持し、値はアクセスのたびにファイルの該当範囲から
+    デコードします。with 文で使うか、使い終わったら close() してください。
+    """
+
+    def __init__(self, json_file=DEFAULT_F_TO_C_FILE, index_file=None):
+        self._file = None
+        self._map = None
+        self._loaded = None
+
+        if _is_compressed(json_file):
+            self._json_file = json_file
+            self._keys = None
+            return
+
+        self._keys, self._offsets, self._lengths = load_index(json_file, index_file)
+        self._positions = {key: i for i, key in enumerate(self._keys)}
+        self._file = open(json_file, 'rb')
+        if os.path.getsize(json_file):
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _load_all(self):
+        if self._loaded is None:
+            self._loaded = load_json(self._json_file)
+        return self._loaded
+
+    def __len__(self):
+        if self._keys is None:
+            return len(self._load_all())
+        return len(self._keys)
+
+    def __iter__(self):
+        if self._keys is None:
+            return iter(self._load_all())
+        return iter(self._keys)
+
+    def __contains__(self, key):
+        if self._keys is None:
+            return key in self._load_all()
+        return key in self._positions
+
+    def __getitem__(self, key):
+        if self._keys is None:
+            return self._load_all()[key]
+        return self._decode(self._positions[key])
+
+    def _decode(self, position):
+        offset = self._offsets[position]
+        return json.loads(self._map[offset:offset + self._lengths[position]].decode('utf-8'))
+
+    def items_in_range(self, start, end):
+        """'U+XXXX' キーのうち start <= コードポイント <= end のエントリだけを返す"""
+        for key in self:
+            match = _UNICODE_KEY.fullmatch(key)
+            if match and start <= int(match.group(1), 16) <= end:
+                yield key, self[key]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+if __name__ == "__main__":
+    # 使い方: python3 f_to_c_index.py U+3404 [U+3405 ...]
+    with LazyFToCMapping() as mapping:
+        print(f"{len(mapping):,} エントリ")
+        for key in sys.argv[1:]:
+            if key in mapping:
+                print(f"{key}: {json.dumps(mapping[key], ensure_ascii=False)}")
+            else:
+                print(f"{key}: 見つかりません")
@@ -1,167 +1,54 @@
 #!/usr/bin/env python3
+import os
+import sys
 import json
 
+from ivs_records import utf16_code_units
+from pua_allocation_strategy_staged import (load_staged_pua_mapping, allocation_summary, allocation_token,
+                                            generated_output_is_current, record_generated_output)
+
+OUTPUT_FILE = "extract_ivs_glyphs_mj_based.py"
+STATS_FILE = "../mj_based_extraction_stats.json"
+
 def create_mj_based_extraction():
-    """MJ文字図形名を使用したIVS文字抽出スクリプトを作成"""
+    """MJ文字図形名を使用したIVS文字抽出スクリプトを作成し、マッピング数を返す"""
     
     try:
-        # JSON データを読み込み
-        with open("../mji_analysis_f_to_c_mapping.json", 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        print(f"データを読み込みました: {len(data)} エントリ")
-        
-        # 段階的PUA配置戦略をインポート
-        try:
-            from pua_allocation_strategy_staged import get_staged_pua_strategy
-            pua_strategy = get_staged_pua_strategy()
-            bmp_pua_start = pua_strategy['bmp_pua']['start']  # 0xE000
-            smp_pua_start = pua_strategy['smp_pua']['start']  # 0xF0000
-            print(f"✓ 段階的PUA戦略を使用: BMP=0x{bmp_pua_start:04X}, SMP=0x{smp_pua_start:05X}")
-        except Exception as e:
-            print(f"⚠ 段階的PUA戦略の読み込みに失敗、従来方式を使用: {e}")
-            bmp_pua_start = 0xE000  # 修正: 0xE200 -> 0xE000
-            smp_pua_start = 0xF0000
-        
-        # IVS文字列からMJ文字図形名へのマッピングを作成
+        # カタログの取り込み以降、配置もこのスクリプトも変わっていなければ作り直さない
+        if (generated_output_is_current(OUTPUT_FILE, allocation_token(), __file__)
+                and os.path.exists(STATS_FILE)):
+            with open(STATS_FILE, 'r', encoding='utf-8') as f:
+                total = json.load(f)["total_ivs_to_mj_mappings"]
+            print(f"✓ 配置が前回の生成から変わっていないため省略: {OUTPUT_FILE}")
+            return total
+        
+        # 段階的PUA配置（ビルドで1回だけ計算され staged_pua_mappings.json に保存される）
+        pua_allocation_map = load_staged_pua_mapping()
+        summary = allocation_summary(pua_allocation_map)
+        bmp_pua_start, bmp_pua_current = summary['bmp_start'], summary['bmp_next']
+        smp_pua_start, smp_pua_current = summary['smp_start'], summary['smp_next']
+        bmp_pua_allocated = summary['bmp_allocated']
+        smp_pua_allocated = summary['smp_allocated']
+        p16_pua_start, p16_pua_current = summary['p16_start'], summary['p16_next']
+        p16_pua_allocated = summary['p16_allocated']
+        
+        print(f"PUA配置を読み込みました: {len(pua_allocation_map)} エントリ")
+        
+        # IVS文字列（UTF-16コード単位）からMJ文字図形名・PUAコードへのマッピングを作成
         ivs_to_mj_mapping = {}
         ivs_mappings = {}
-        current_pua = bmp_pua_start
         
         print("IVS文字列とMJ文字図形名のマッピングを生成中...")
         
-        # 第1段階: 全てのIVS文字を収集してVS別にグループ化
-        temp_chars = []
-        vs_groups = {}
+        for ivs_sequence, info in pua_allocation_map.items():
+            key = utf16_code_units(ivs_sequence)
+            ivs_to_mj_mapping[key] = info['mj_number'].lower()
+            ivs_mappings[key] = info['pua_code']
         
-        # 各エントリからIVS文字列とMJ名のマッピングを生成
-        for unicode_key, entry in data.items():
-            if unicode_key.startswith('U+'):
-                try:
-                    unicode_code = int(unicode_key[2:], 16)
-                    
-                    # F列の値からIVS文字列を生成
-                    if "C_values_with_F" in entry:
-                        for f_value, c_value in entry["C_values_with_F"].items():
-                            if '_' in f_value:
-                                parts = f_value.split('_')
-                                if len(parts) == 2:
-                                    selector_hex = parts[1]  # E0100
-                                    
-                                    if selector_hex.startswith('E01'):
-                                        selector_num = int(selector_hex[3:], 16)
-                                        
-                                        # VS17-VS256の範囲（E0100-E01EF）
-                                        vs_code = 0xE0100 + selector_num
-                                        vs_name = f"VS{17 + selector_num}"
-                                        
-                                        # IVS文字列を生成
-                                        high_surrogate = ((vs_code - 0x10000) >> 10) + 0xD800
-                                        low_surrogate = ((vs_code - 0x10000) & 0x3FF) + 0xDC00
-                                        
-                                        base_char = chr(unicode_code)
-                                        vs_chars = chr(high_surrogate) + chr(low_surrogate)
-                                        ivs_sequence = base_char + vs_chars
-                                        
-                                        # MJ名を小文字に変換
-                                        mj_name = c_value.lower()
-                                        
-                                        # 一時データに保存（段階的配置のため）
-                                        char_data = {
-                                            'ivs_sequence': ivs_sequence,
-                                            'mj_name': mj_name,
-                                            'vs_name': vs_name,
-                                            'unicode_code': unicode_code,
-                                            'vs_code': vs_code
-                                        }
-                                        
-                                        # VS別にグループ化
-                                        if vs_name not in vs_groups:
-                                            vs_groups[vs_name] = []
-                                        vs_groups[vs_name].append(char_data)
-                                        temp_chars.append(char_data)
-                                    
-                except ValueError:
-                    continue
-        
-        print(f"✓ 収集完了: {len(temp_chars)}文字、{len(vs_groups)}種類のVS")
-        
-        # VS別の文字数を表示
-        for vs_name in sorted(vs_groups.keys()):
-            print(f"  {vs_name}: {len(vs_groups[vs_name])}文字")
-        
-        # 第2段階: 段階的PUA配置戦略に基づく配置
-        print(f"\n第2段階: 段階的PUA配置...")
-        
-        # VS優先度リスト（使用頻度降順）
-        vs_priority = ["VS19", "VS18", "VS20", "VS17", "VS21", "VS22", "VS23", "VS24", "VS25", "VS26", "VS27", "VS28", "VS29", "VS30", "VS31", "VS32"]
-        
-        bmp_pua_current = bmp_pua_start  # 0xE000
-        smp_pua_current = smp_pua_start  # 0xF0000
-        bmp_pua_end = 0xF8FF
-        bmp_pua_allocated = 0
-        smp_pua_allocated = 0
-        
-        # 優先度に基づく段階的配置
-        for vs_name in vs_priority:
-            if vs_name in vs_groups:
-                chars_in_vs = vs_groups[vs_name]
-                
-                if vs_name in ["VS19", "VS18"]:
-                    # 全てBMP PUAに配置
-                    for char_data in chars_in_vs:
-                        if bmp_pua_current <= bmp_pua_end:
-                            pua_code = bmp_pua_current
-                            ivs_to_mj_mapping[char_data['ivs_sequence']] = char_data['mj_name']
-                            ivs_mappings[char_data['ivs_sequence']] = pua_code
-                            bmp_pua_current += 1
-                            bmp_pua_allocated += 1
-                        else:
-                            # BMP PUA領域が満杯の場合、SMP PUAに移行
-                            pua_code = smp_pua_current
-                            ivs_to_mj_mapping[char_data['ivs_sequence']] = char_data['mj_name']
-                            ivs_mappings[char_data['ivs_sequence']] = pua_code
-                            smp_pua_current += 1
-                            smp_pua_allocated += 1
-                    
-                    print(f"✓ {vs_name}: {len(chars_in_vs):,}文字 → BMP PUA")
-                    
-                elif vs_name == "VS20":
-                    # VS20は部分的配置
-                    bmp_portion = min(len(chars_in_vs), bmp_pua_end - bmp_pua_current + 1)
-                    
-                    for i, char_data in enumerate(chars_in_vs):
-                        if i < bmp_portion and bmp_pua_current <= bmp_pua_end:
-                            # BMP PUAに配置
-                            pua_code = bmp_pua_current
-                            ivs_to_mj_mapping[char_data['ivs_sequence']] = char_data['mj_name']
-                            ivs_mappings[char_data['ivs_sequence']] = pua_code
-                            bmp_pua_current += 1
-                            bmp_pua_allocated += 1
-                        else:
-                            # SMP PUAに配置
-                            pua_code = smp_pua_current
-                            ivs_to_mj_mapping[char_data['ivs_sequence']] = char_data['mj_name']
-                            ivs_mappings[char_data['ivs_sequence']] = pua_code
-                            smp_pua_current += 1
-                            smp_pua_allocated += 1
-                    
-                    print(f"⚠ {vs_name}: {bmp_portion:,}文字 → BMP PUA, {len(chars_in_vs)-bmp_portion:,}文字 → SMP PUA")
-                    
-                else:
-                    # VS17, VS21以降は全てSMP PUAに配置
-                    for char_data in chars_in_vs:
-                        pua_code = smp_pua_current
-                        ivs_to_mj_mapping[char_data['ivs_sequence']] = char_data['mj_name']
-                        ivs_mappings[char_data['ivs_sequence']] = pua_code
-                        smp_pua_current += 1
-                        smp_pua_allocated += 1
-                    
-                    print(f"→ {vs_name}: {len(chars_in_vs):,}文字 → SMP PUA")
-        
-        print(f"\n配置完了:")
-        print(f"BMP PUA: {bmp_pua_allocated:,}文字 (0x{bmp_pua_start:04X}-0x{bmp_pua_current-1:04X})")
-        print(f"SMP PUA: {smp_pua_allocated:,}文字 (0x{smp_pua_start:05X}-0x{smp_pua_current-1:05X})")
+        print(f"\n配置:")
+        print(f"BMP PUA: {bmp_pua_allocated:,}文字 ({summary['bmp_range'] or '未使用'})")
+        print(f"SMP PUA: {smp_pua_allocated:,}文字 ({summary['smp_range'] or '未使用'})")
+        print(f"SMP PUA (16面): {p16_pua_allocated:,}文字 ({summary['p16_range'] or '未使用'})")
         print(f"総マッピング数: {len(ivs_to_mj_mapping):,}")
         
         print(f"IVS-MJマッピング生成完了: {len(ivs_to_mj_mapping)} エントリ")
@@ -176,6 +63,39 @@ import sys
 import os
 import json
 
+from ivs_records import utf16_escape, js_string
+from pua_allocation_strategy_staged import summarize_pua_codes
+
+# IVS文字列（UTF-16コード単位）からMJ文字図形名へのマッピング
+IVS_TO_MJ_MAPPING = {
+'''
+        
+        # IVS_TO_MJ_MAPPINGの内容を追加
+        mapping_lines = []
+        for ivs_seq, mj_name in ivs_to_mj_mapping.items():
+            key_repr = repr(ivs_seq)
+            mapping_lines.append(f"    {key_repr}: '{mj_name}',")
+        
+        python_code += '\n'.join(mapping_lines)
+        
+        python_code += '''
+}
+
+# IVS文字列からPUAコードへのマッピング
+IVS_MAPPINGS = {
+'''
+        
+        # IVS_MAPPINGSの内容を追加
+        mapping_lines = []
+        for ivs_seq, pua_code in ivs_mappings.items():
+            key_repr = repr(ivs_seq)
+            mapping_lines.append(f"    {key_repr}: {hex(pua_code)},")
+        
+        python_code += '\n'.join(mapping_lines)
+        
+        python_code += '''
+}
+
 def extract_ivs_glyphs():
     """MJ文字図形名を使用してIVS文字のグリフを抽出して外字フォントを作成"""
     
@@ -253,42 +173,12 @@ def extract_ivs_glyphs():
         
         print(f"基本文字 {copied_basic_count}文字をコピーしました")
         
-        # IVS文字列からMJ文字図形名へのマッピング
-        ivs_to_mj_mapping = {
-'''
-        
-        # ivs_to_mj_mappingの内容を追加
-        mapping_lines = []
-        for ivs_seq, mj_name in ivs_to_mj_mapping.items():
-            key_repr = repr(ivs_seq)
-            mapping_lines.append(f"            {key_repr}: '{mj_name}',")
-        
-        python_code += '\n'.join(mapping_lines)
-        
-        python_code += '''
-        }
-        
-        # IVS文字列からPUAコードへのマッピング
-        ivs_mappings = {
-'''
-        
-        # ivs_mappingsの内容を追加
-        mapping_lines = []
-        for ivs_seq, pua_code in ivs_mappings.items():
-            key_repr = repr(ivs_seq)
-            mapping_lines.append(f"            {key_repr}: {hex(pua_code)},")
-        
-        python_code += '\n'.join(mapping_lines)
-        
-        python_code += '''
-        }
-        
         # MJ文字図形名を使用してIVS文字を抽出
         extracted_count = 0
         failed_count = 0
         
-        for ivs_sequence, mj_name in ivs_to_mj_mapping.items():
-            pua_code = ivs_mappings[ivs_sequence]
+        for ivs_sequence, mj_name in IVS_TO_MJ_MAPPING.items():
+            pua_code = IVS_MAPPINGS[ivs_sequence]
             
             # MJ文字図形名がフォントに存在するかチェック
             if mj_name in original_font:
@@ -349,165 +239,32 @@ def generate_mapping_file():
     """IVS文字マッピング定義ファイルを生成（段階的PUA配置対応）"""
     
     try:
-        with open("../mji_analysis_f_to_c_mapping.json", 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
         print("IVS文字マッピングを段階的PUA戦略で生成中...")
         
-        # 段階的PUA配置戦略をインポート
-        try:
-            from pua_allocation_strategy_staged import get_staged_pua_strategy
-            pua_strategy = get_staged_pua_strategy()
-            bmp_pua_start = pua_strategy['bmp_pua']['start']  # 0xE000
-            smp_pua_start = pua_strategy['smp_pua']['start']  # 0xF0000
-            print(f"✓ 段階的PUA戦略を使用: BMP=0x{bmp_pua_start:04X}, SMP=0x{smp_pua_start:05X}")
-        except Exception as e:
-            print(f"⚠ 段階的PUA戦略の読み込みに失敗、修正済み方式を使用: {e}")
-            bmp_pua_start = 0xE000  # 修正: 0xE200 -> 0xE000
-            smp_pua_start = 0xF0000
-        
-        # JavaScript用のマッピングを生成
-        js_mappings = []
+        # フォントに埋め込んだのと同じ配置（IVS_MAPPINGS）から生成する
+        summary = summarize_pua_codes(IVS_MAPPINGS.values())
+        bmp_pua_allocated = summary['bmp_allocated']
+        smp_pua_allocated = summary['smp_allocated']
+        p16_pua_allocated = summary['p16_allocated']
         
-        # 第1段階: 全てのIVS文字を収集してVS別にグループ化
-        temp_chars = []
-        vs_groups = {}
-        
-        # 各エントリからIVS文字列を生成してVS別にグループ化
-        for unicode_key, entry in data.items():
-            if unicode_key.startswith('U+'):
-                try:
-                    unicode_code = int(unicode_key[2:], 16)
-                    
-                    # F列の値からIVS文字列を生成
-                    if "C_values_with_F" in entry:
-                        for f_value, c_value in entry["C_values_with_F"].items():
-                            if '_' in f_value:
-                                parts = f_value.split('_')
-                                if len(parts) == 2:
-                                    selector_hex = parts[1]  # E0100
-                                    
-                                    if selector_hex.startswith('E01'):
-                                        selector_num = int(selector_hex[3:], 16)
-                                        
-                                        # VS17-VS256の範囲（E0100-E01EF）
-                                        vs_code = 0xE0100 + selector_num
-                                        vs_name = f"VS{17 + selector_num}"
-                                        
-                                        # JavaScript用文字列を生成（エスケープ形式、SMP対応）
-                                        if unicode_code <= 0xFFFF:
-                                            base_char_escaped = "\\\\u{:04X}".format(unicode_code)
-                                        else:
-                                            # SMP文字はサロゲートペアとして表現
-                                            high = ((unicode_code - 0x10000) >> 10) + 0xD800
-                                            low = ((unicode_code - 0x10000) & 0x3FF) + 0xDC00
-                                            base_char_escaped = "\\\\u{:04X}\\\\u{:04X}".format(high, low)
-                                        
-                                        # サロゲートペアを計算
-                                        high_surrogate = ((vs_code - 0x10000) >> 10) + 0xD800
-                                        low_surrogate = ((vs_code - 0x10000) & 0x3FF) + 0xDC00
-                                        
-                                        vs_chars_escaped = "\\\\u{:04X}\\\\u{:04X}".format(high_surrogate, low_surrogate)
-                                        
-                                        # IVS文字データを一時保存
-                                        char_data = {
-                                            'ivs_sequence': base_char_escaped + vs_chars_escaped,
-                                            'vs_name': vs_name,
-                                            'c_value': c_value,
-                                            'unicode_code': unicode_code,
-                                            'vs_code': vs_code
-                                        }
-                                        
-                                        # VS別にグループ化
-                                        if vs_name not in vs_groups:
-                                            vs_groups[vs_name] = []
-                                        vs_groups[vs_name].append(char_data)
-                                        temp_chars.append(char_data)
-                                        
-                except ValueError:
-                    continue
-        
-        print(f"✓ 収集完了: {len(temp_chars)}文字、{len(vs_groups)}種類のVS")
-        
-        # 第2段階: 段階的PUA配置戦略に基づくJavaScript生成
-        print(f"\\n第2段階: 段階的PUA配置...")
-        
-        # VS優先度リスト（使用頻度降順）
-        vs_priority = ["VS19", "VS18", "VS20", "VS17", "VS21", "VS22", "VS23", "VS24", "VS25", "VS26", "VS27", "VS28", "VS29", "VS30", "VS31", "VS32"]
-        
-        bmp_pua_current = bmp_pua_start  # 0xE000
-        smp_pua_current = smp_pua_start  # 0xF0000
-        bmp_pua_end = 0xF8FF
-        bmp_pua_allocated = 0
-        smp_pua_allocated = 0
-        
-        # 段階的配置によるJavaScriptマッピング生成
-        for vs_name in vs_priority:
-            if vs_name in vs_groups:
-                chars_in_vs = vs_groups[vs_name]
-                
-                if vs_name in ["VS19", "VS18"]:
-                    # 全てBMP PUAに配置
-                    for char_data in chars_in_vs:
-                        if bmp_pua_current <= bmp_pua_end:
-                            pua_char = "\\\\u{:04X}".format(bmp_pua_current)
-                            js_mappings.append(f"  '{char_data['ivs_sequence']}': '{pua_char}',  // {char_data['c_value']}")
-                            bmp_pua_current += 1
-                            bmp_pua_allocated += 1
-                        else:
-                            # BMP PUA領域が満杯の場合、SMP PUAに移行（サロゲートペア）
-                            high = ((smp_pua_current - 0x10000) >> 10) + 0xD800
-                            low = ((smp_pua_current - 0x10000) & 0x3FF) + 0xDC00
-                            pua_char = "\\\\u{:04X}\\\\u{:04X}".format(high, low)
-                            js_mappings.append(f"  '{char_data['ivs_sequence']}': '{pua_char}',  // {char_data['c_value']}")
-                            smp_pua_current += 1
-                            smp_pua_allocated += 1
-                    
-                    print(f"✓ {vs_name}: {len(chars_in_vs):,}文字 → BMP PUA")
-                    
-                elif vs_name == "VS20":
-                    # VS20は部分的配置
-                    bmp_portion = min(len(chars_in_vs), bmp_pua_end - bmp_pua_current + 1)
-                    
-                    for i, char_data in enumerate(chars_in_vs):
-                        if i < bmp_portion and bmp_pua_current <= bmp_pua_end:
-                            # BMP PUAに配置
-                            pua_char = "\\\\u{:04X}".format(bmp_pua_current)
-                            js_mappings.append(f"  '{char_data['ivs_sequence']}': '{pua_char}',  // {char_data['c_value']}")
-                            bmp_pua_current += 1
-                            bmp_pua_allocated += 1
-                        else:
-                            # SMP PUAに配置（サロゲートペア）
-                            high = ((smp_pua_current - 0x10000) >> 10) + 0xD800
-                            low = ((smp_pua_current - 0x10000) & 0x3FF) + 0xDC00
-                            pua_char = "\\\\u{:04X}\\\\u{:04X}".format(high, low)
-                            js_mappings.append(f"  '{char_data['ivs_sequence']}': '{pua_char}',  // {char_data['c_value']}")
-                            smp_pua_current += 1
-                            smp_pua_allocated += 1
-                    
-                    print(f"⚠ {vs_name}: {bmp_portion:,}文字 → BMP PUA, {len(chars_in_vs)-bmp_portion:,}文字 → SMP PUA")
-                    
-                else:
-                    # VS17, VS21以降は全てSMP PUAに配置（サロゲートペア）
-                    for char_data in chars_in_vs:
-                        high = ((smp_pua_current - 0x10000) >> 10) + 0xD800
-                        low = ((smp_pua_current - 0x10000) & 0x3FF) + 0xDC00
-                        pua_char = "\\\\u{:04X}\\\\u{:04X}".format(high, low)
-                        js_mappings.append(f"  '{char_data['ivs_sequence']}': '{pua_char}',  // {char_data['c_value']}")
-                        smp_pua_current += 1
-                        smp_pua_allocated += 1
-                    
-                    print(f"→ {vs_name}: {len(chars_in_vs):,}文字 → SMP PUA")
+        # JavaScript用のマッピングを生成（キーはUTF-16コード単位、SMP PUAはサロゲートペア）
+        js_mappings = []
+        for ivs_sequence, mj_name in IVS_TO_MJ_MAPPING.items():
+            ivs_escaped = "".join("\\\\u{:04X}".format(ord(unit)) for unit in ivs_sequence)
+            pua_char = utf16_escape(chr(IVS_MAPPINGS[ivs_sequence]))
+            js_mappings.append(f"  '{ivs_escaped}': '{pua_char}',  // {mj_name.upper()}")
         
         print(f"\\nJavaScript配置完了:")
-        print(f"BMP PUA: {bmp_pua_allocated:,}文字 (0x{bmp_pua_start:04X}-0x{bmp_pua_current-1:04X})")
-        print(f"SMP PUA: {smp_pua_allocated:,}文字 (0x{smp_pua_start:05X}-0x{smp_pua_current-1:05X})")
+        print(f"BMP PUA: {bmp_pua_allocated:,}文字 ({summary['bmp_range'] or '未使用'})")
+        print(f"SMP PUA: {smp_pua_allocated:,}文字 ({summary['smp_range'] or '未使用'})")
+        print(f"SMP PUA (16面): {p16_pua_allocated:,}文字 ({summary['p16_range'] or '未使用'})")
         print(f"総マッピング数: {len(js_mappings):,}")
         
         # JavaScript内容を生成（SMP文字対応ユーティリティ付き）
         js_content = """// IVS文字マッピング定義（段階的PUA配置対応）
 // BMP PUA: 0xE000-0xF8FF (6,400文字) - 高頻度VS優先
 // SMP PUA: 0xF0000- (65,534文字) - 残りのVS
+// SMP PUA (16面): 0x100000- (65,534文字) - 15面に入りきらない文字
 
 // SMP文字変換ユーティリティ
 export function convertSMPToString(codePoint) {
@@ -552,12 +309,17 @@ export const puaAllocationStats = {{
     bmpPUA: {{
         allocated: {bmp_pua_allocated},
         capacity: 6400,
-        range: '0x{bmp_pua_start:04X}-0x{bmp_pua_current-1:04X}'
+        range: {js_string(summary['bmp_range'])}
     }},
     smpPUA: {{
         allocated: {smp_pua_allocated},
         capacity: 65534,
-        range: '0x{smp_pua_start:05X}-0x{smp_pua_current-1:05X}'
+        range: {js_string(summary['smp_range'])}
+    }},
+    smpP16PUA: {{
+        allocated: {p16_pua_allocated},
+        capacity: 65534,
+        range: {js_string(summary['p16_range'])}
     }},
     totalCharacters: {len(js_mappings)}
 }};
@@ -598,7 +360,7 @@ if __name__ == "__main__":
 '''
         
         # ファイルに書き込み
-        with open("extract_ivs_glyphs_mj_based.py", 'w', encoding='utf-8') as f:
+        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
             f.write(python_code)
         
         print(f"\\nMJベースの抽出スクリプトを作成しました: extract_ivs_glyphs_mj_based.py")
@@ -608,23 +370,27 @@ if __name__ == "__main__":
             "total_ivs_to_mj_mappings": len(ivs_to_mj_mapping),
             "total_ivs_mappings": len(ivs_mappings),
             "bmp_pua_start": hex(bmp_pua_start),
-            "bmp_pua_end": hex(bmp_pua_current-1),
+            "bmp_pua_end": hex(bmp_pua_current-1) if bmp_pua_allocated else None,
             "smp_pua_start": hex(smp_pua_start),
-            "smp_pua_end": hex(smp_pua_current-1),
+            "smp_pua_end": hex(smp_pua_current-1) if smp_pua_allocated else None,
+            "p16_pua_start": hex(p16_pua_start),
+            "p16_pua_end": hex(p16_pua_current-1) if p16_pua_allocated else None,
             "bmp_pua_allocated": bmp_pua_allocated,
             "smp_pua_allocated": smp_pua_allocated,
+            "p16_pua_allocated": p16_pua_allocated,
             "allocation_strategy": "staged_pua_allocation",
             "sample_mappings": {
                 repr(k): v for k, v in list(ivs_to_mj_mapping.items())[:10]
             }
         }
         
-        with open("../mj_based_extraction_stats.json", 'w', encoding='utf-8') as f:
+        with open(STATS_FILE, 'w', encoding='utf-8') as f:
             json.dump(stats, f, ensure_ascii=False, indent=2)
+        record_generated_output(OUTPUT_FILE, allocation_token(), __file__)
         
         print(f"統計情報を保存しました: mj_based_extraction_stats.json")
         
-        return ivs_to_mj_mapping
+        return len(ivs_to_mj_mapping)
         
     except Exception as e:
         print(f"エラーが発生しました: {e}")
@@ -640,10 +406,11 @@ if __name__ == "__main__":
     
     if result:
         print("\\n✓ MJベースの抽出スクリプトの作成が完了しました")
-        print(f"総マッピング数: {len(result)}")
+        print(f"総マッピング数: {result}")
         print("\\n改善点:")
         print("- 基本文字ではなくMJ文字図形名を使用")
         print("- 各IVS文字の正しい字形を抽出")
         print("- フォント内のグリフ名を事前確認")
     else:
-        print("\\n✗ MJベースの抽出スクリプトの作成に失敗しました")
\ No newline at end of file
+        print("\\n✗ MJベースの抽出スクリプトの作成に失敗しました")
+        sys.exit(1)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+F→Cマッピングの固定長バイナリ形式（メモリマップで読み込み可能）
+
+mji_analysis_f_to_c_mapping.json の各IVSレコードを、基底文字のコードポイント、
+異体字セレクタ番号（0 = VS17 = U+E0100）、MJ番号の3つの32bit整数として保存します。
+読み込み側は mmap した領域をそのまま struct で展開するため、JSONの解析や
+'U+3404'、'3404_E0102' といった文字列の解析は不要です。
+
+ファイル形式（リトルエンディアン）:
+    ヘッダ 16バイト: magic b'IVSB', version (u16), record_size (u16), count (u32), 予約 (u32)
+    レコード 12バイト × count: base_code (u32), selector_index (u32), mj_number (u32)
+"""
+import mmap
+import re
+import struct
+
+MAGIC = b'IVSB'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<4sHHII')
+_RECORD = struct.Struct('<III')
+
+# MJ文字図形名は 'MJ' + 6桁（読み込み側は f"MJ{n:06d}" で復元できる）
+_MJ_PATTERN = re.compile(r'MJ(\d{6})')
+
+DEFAULT_BINARY_FILE = "../mji_ivs_records.bin"
+
+def iter_f_to_c_records(data):
+    """F→Cマッピングから (基底コードポイント, セレクタ番号, MJ文字図形名) を順に取り出す
+
+    各生成スクリプトと同じ規則で 'U+' キーと E01xx セレクタのみを対象にします。
+    """
+    for unicode_key, entry in data.items():
+        if not unicode_key.startswith('U+'):
+            continue
+        try:
+            unicode_code = int(unicode_key[2:], 16)
+            for f_value, c_value in entry.get("C_values_with_F", {}).items():
+                parts = f_value.split('_')
+                if len(parts) != 2:
+                    continue
+                selector_hex = parts[1]  # E0100
+                if selector_hex.startswith('E01'):
+                    yield unicode_code, int(selector_hex[3:], 16), c_value
+        except ValueError:
+            continue
+
+def write_ivs_binary(data, path=DEFAULT_BINARY_FILE):
+    """F→Cマッピングをバイナリ形式で保存し、レコード数を返す"""
+    records = bytearray()
+    count = 0
+    for unicode_code, selector_index, mj_name in iter_f_to_c_records(data):
+        match = _MJ_PATTERN.fullmatch(mj_name)
+        if not match:
+            raise ValueError(f"MJ文字図形名として解釈できません: {mj_name!r} (U+{unicode_code:04X})")
+        records += _RECORD.pack(unicode_code, selector_index, int(match.group(1)))
+        count += 1
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, _RECORD.size, count, 0))
+        f.write(records)
+    return count
+
+class IVSBinary:
+    """メモリマップしたIVSレコード列
+
+    イテレーションとインデックス参照で (base_code, selector_index, mj_number)
+    のタプルを返します。with 文で使うか、使い終わったら close() してください。
+    """
+
+    def __init__(self, path=DEFAULT_BINARY_FILE):
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空ファイルは mmap できない
+            self._file.close()
+            raise ValueError(f"{path} はIVSバイナリではありません")
+
+        if len(self._map) < _HEADER.size:
+            self.close()
+            raise ValueError(f"{path} はIVSバイナリではありません")
+
+        magic, version, record_size, count, _ = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or record_size != _RECORD.size:
+            self.close()
+            raise ValueError(f"{path} はIVSバイナリではありません")
+        if version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} の形式バージョン {version} には対応していません")
+        if _HEADER.size + count * record_size > len(self._map):
+            self.close()
+            raise ValueError(f"{path} が途中で切れています")
+
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return _RECORD.unpack_from(self._map, _HEADER.size + index * _RECORD.size)
+
+    def __iter__(self):
+        # レコード領域を一括でコピーして展開する（mmap のバッファを握り続けない）
+        end = _HEADER.size + self._count * _RECORD.size
+        return _RECORD.iter_unpack(self._map[_HEADER.size:end])
+
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
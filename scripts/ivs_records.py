@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+デコード済みIVSレコードの共通ストリーム
+
+F→Cマッピングの各IVSを一度だけ IVSRecord（基底コードポイント、セレクタ番号、
+MJ番号、UTF-16・UTF-8表現など）にデコードします。生成スクリプトは
+iter_ivs_records() でジェネレータとして順に読むか、load_ivs_records() で
+キャッシュ済みのタプルとして受け取ります。
+
+load_ivs_records() は parse_excel_with_f_column.py が出力した
+mji_ivs_records.bin がJSONより新しければそちらを使い、文字列の解析を省きます。
+"""
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+
+from ivs_binary import iter_f_to_c_records, IVSBinary, DEFAULT_BINARY_FILE
+from json_io import load_json
+
+DEFAULT_F_TO_C_FILE = "../mji_analysis_f_to_c_mapping.json"
+
+VS_BASE = 0xE0100  # VS17
+
+_MJ_PATTERN = re.compile(r'MJ(\d{6})')
+
+IVSRecord = namedtuple("IVSRecord", [
+    "unicode_code",    # 基底文字のコードポイント
+    "vs_index",        # 0 = VS17 (U+E0100)
+    "vs_code",         # 異体字セレクタのコードポイント
+    "vs_name",         # 'VS17' など
+    "mj_name",         # C列のMJ文字図形名 'MJ000001'
+    "mj_number",       # MJ文字図形名の番号（MJ形式でなければ None）
+    "ivs_sequence",    # 基底文字 + 異体字セレクタ
+    "utf16",           # UTF-16コード単位の文字列（サロゲートペアを1文字ずつ持つ）
+    "utf16_escaped",   # JavaScript用のエスケープ表現 '\\u3404\\uDB40\\uDD02'
+    "utf8",            # UTF-8バイト列
+])
+
+def _utf16_units(code):
+    if code <= 0xFFFF:
+        return (code,)
+    code -= 0x10000
+    return ((code >> 10) + 0xD800, (code & 0x3FF) + 0xDC00)
+
+def utf16_code_units(text):
+    """文字列をUTF-16コード単位の文字列にする（SMPの文字はサロゲートペアの2文字）"""
+    return "".join(chr(unit) for char in text for unit in _utf16_units(ord(char)))
+
+def utf16_escape(text):
+    """JavaScript用の '\\uXXXX' エスケープ表現（SMPの文字はサロゲートペア）"""
+    return "".join("\\u{:04X}".format(unit) for char in text for unit in _utf16_units(ord(char)))
+
+def js_string(value):
+    """範囲などの単純な値をJSの文字列リテラルにする（None なら null）"""
+    return "null" if value is None else f"'{value}'"
+
+def make_record(unicode_code, vs_index, mj_name, mj_number=None):
+    """(基底コードポイント, セレクタ番号, MJ文字図形名) から IVSRecord を作成"""
+    vs_code = VS_BASE + vs_index
+    if mj_number is None:
+        match = _MJ_PATTERN.fullmatch(mj_name)
+        mj_number = int(match.group(1)) if match else None
+
+    ivs_sequence = chr(unicode_code) + chr(vs_code)
+    return IVSRecord(
+        unicode_code,
+        vs_index,
+        vs_code,
+        f"VS{17 + vs_index}",
+        mj_name,
+        mj_number,
+        ivs_sequence,
+        utf16_code_units(ivs_sequence),
+        utf16_escape(ivs_sequence),
+        ivs_sequence.encode('utf-8'),
+    )
+
+def iter_ivs_records(data):
+    """F→Cマッピング（dict）から IVSRecord を順に生成する"""
+    for unicode_code, vs_index, mj_name in iter_f_to_c_records(data):
+        try:
+            yield make_record(unicode_code, vs_index, mj_name)
+        except ValueError:
+            # コードポイントの範囲外
+            continue
+
+def iter_binary_records(binary_file=DEFAULT_BINARY_FILE):
+    """mji_ivs_records.bin から IVSRecord を順に生成する"""
+    with IVSBinary(binary_file) as records:
+        for unicode_code, vs_index, mj_number in records:
+            yield make_record(unicode_code, vs_index, f"MJ{mj_number:06d}", mj_number)
+
+def _binary_is_current(json_file, binary_file):
+    try:
+        return os.path.getmtime(binary_file) >= os.path.getmtime(json_file)
+    except OSError:
+        # JSONがなければバイナリだけで足りる
+        return os.path.exists(binary_file)
+
+_cache = {}
+
+def load_ivs_records(json_file=DEFAULT_F_TO_C_FILE, binary_file=DEFAULT_BINARY_FILE):
+    """IVSRecord のタプルを返す（同じプロセス内ではキャッシュを再利用）"""
+    key = (os.path.abspath(json_file), os.path.abspath(binary_file))
+    if key not in _cache:
+        if _binary_is_current(json_file, binary_file):
+            _cache[key] = tuple(iter_binary_records(binary_file))
+        else:
+            _cache[key] = tuple(iter_ivs_records(load_json(json_file)))
+    return _cache[key]
+
+def _benchmark(json_file, binary_file):
+    """JSON経由とバイナリ経由のデコード時間を比較"""
+    started = time.perf_counter()
+    from_json = sum(1 for _ in iter_ivs_records(load_json(json_file)))
+    json_seconds = time.perf_counter() - started
+    print(f"JSON:   {from_json:,}レコード {json_seconds:.3f}秒")
+
+    if os.path.exists(binary_file):
+        started = time.perf_counter()
+        from_binary = sum(1 for _ in iter_binary_records(binary_file))
+        binary_seconds = time.perf_counter() - started
+        print(f"Binary: {from_binary:,}レコード {binary_seconds:.3f}秒")
+
+if __name__ == "__main__":
+    json_file = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_F_TO_C_FILE
+    binary_file = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_BINARY_FILE
+
+    print("IVSレコードのデコード時間")
+    print("=" * 50)
+    _benchmark(json_file, binary_file)
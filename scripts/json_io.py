@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+パイプライン中間JSONの書き出し・読み込み
+
+書き出しはプロファイルで形式を選びます。
+
+    compact  改行・空白なし（既定）
+    pretty   indent=2 の人が読める形式（デバッグ用）
+    gzip     compact を gzip 圧縮
+    zstd     compact を zstd 圧縮（zstandard パッケージが必要）
+
+どのプロファイルも JSONEncoder.iterencode() で少しずつ書き出すため、出力全体の
+文字列をメモリ上に作りません。ファイル名は変えないので、読み込み側は
+load_json() を使えば先頭バイトから形式を判定して読み込めます。
+
+既定のプロファイルは環境変数 IVS_JSON_PROFILE で変更できます。
+"""
+import io
+import os
+import gzip
+import json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PROFILES = ("compact", "pretty", "gzip", "zstd")
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+def default_profile():
+    """IVS_JSON_PROFILE が設定されていればその値、なければ 'compact'"""
+    profile = os.environ.get("IVS_JSON_PROFILE", "compact")
+    if profile not in PROFILES:
+        raise ValueError(f"IVS_JSON_PROFILE に未知のプロファイルが指定されています: {profile}")
+    return profile
+
+def _encoder(profile):
+    if profile == "pretty":
+        return json.JSONEncoder(ensure_ascii=False, indent=2)
+    return json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+def _open_for_write(path, profile):
+    if profile == "gzip":
+        return gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+    if profile == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd プロファイルには zstandard パッケージが必要です (pip install zstandard)")
+        raw = open(path, 'wb')
+        writer = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(writer, encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+def write_json(data, path, profile=None):
+    """data を指定プロファイルで path にストリーミング書き出しする"""
+    if profile is None:
+        profile = default_profile()
+    if profile not in PROFILES:
+        raise ValueError(f"未知のJSONプロファイルです: {profile}")
+
+    with _open_for_write(path, profile) as f:
+        for chunk in _encoder(profile).iterencode(data):
+            f.write(chunk)
+
+def _open_for_read(path):
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+
+    if magic.startswith(_GZIP_MAGIC):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if magic.startswith(_ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError(f"{path} はzstd圧縮されています。zstandard パッケージが必要です")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+def load_json(path):
+    """write_json() のどのプロファイルで書かれたJSONでも読み込む"""
+    with _open_for_read(path) as f:
+        return json.load(f)
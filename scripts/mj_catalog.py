@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+MJ文字情報・IVS・PUA配置を1つのSQLiteファイルにまとめたカタログ
+
+parse_excel_with_f_column.py が解析時に MJ行とIVSシーケンスを書き込み、
+pua_allocation_strategy_staged.py がPUA配置を書き込みます。各テーブルには
+参照に使う列のインデックスを張ってあるため、生成スクリプトはJSON全体を
+読み込まずに必要な行だけを問い合わせられます。load_staged_pua_mapping() は
+カタログがF→Cマッピングより新しければ、IVSシーケンスとPUA配置をカタログから
+読みます。
+
+D列キーごとに内容のハッシュを entries テーブルに持ち、再解析時はハッシュが
+変わったエントリの行だけを書き換えます。PUA配置も変わった行だけを更新します。
+何かが変わった取り込みでは meta の ingest_revision が増えます。番号が前回の
+PUA配置時と同じなら、PUA配置とJS・フォント生成は前回の結果をそのまま使います
+（pua_allocation_strategy_staged.allocation_token()）。変更があった場合の
+PUA配置と生成はIVSシーケンス全体からやり直します（D列キー単位では更新しません）。
+"""
+import os
+import json
+import sqlite3
+import hashlib
+
+from ivs_records import iter_ivs_records, make_record, DEFAULT_F_TO_C_FILE
+
+DEFAULT_CATALOG_FILE = "../mji_catalog.sqlite3"
+
+# スキーマを変えたら上げる（古いカタログは作り直す）
+SCHEMA_VERSION = 2
+
+_TABLES = ("meta", "entries", "mj_rows", "ivs_sequences", "pua_allocations")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+-- D列キーの並び順と内容ハッシュ
+CREATE TABLE IF NOT EXISTS entries (
+    d_key TEXT PRIMARY KEY,
+    entry_order INTEGER NOT NULL,
+    content_hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_order ON entries (entry_order);
+
+-- D列キーごとのMJ行（C列 → F列）
+CREATE TABLE IF NOT EXISTS mj_rows (
+    d_key TEXT NOT NULL,
+    c_order INTEGER NOT NULL,
+    b_value TEXT,
+    c_value TEXT NOT NULL,
+    f_value TEXT,
+    PRIMARY KEY (d_key, c_value)
+);
+CREATE INDEX IF NOT EXISTS mj_rows_c_value ON mj_rows (c_value);
+CREATE INDEX IF NOT EXISTS mj_rows_f_value ON mj_rows (f_value);
+
+-- F→Cマッピングから得たIVSシーケンス（entry_order, entry_seq 順が生成スクリプトと同じ順序）
+CREATE TABLE IF NOT EXISTS ivs_sequences (
+    d_key TEXT NOT NULL,
+    entry_seq INTEGER NOT NULL,
+    ivs_sequence TEXT NOT NULL,
+    base_code INTEGER NOT NULL,
+    selector_index INTEGER NOT NULL,
+    vs_name TEXT NOT NULL,
+    mj_name TEXT NOT NULL,
+    PRIMARY KEY (d_key, entry_seq)
+);
+CREATE INDEX IF NOT EXISTS ivs_sequences_vs_name ON ivs_sequences (vs_name);
+CREATE INDEX IF NOT EXISTS ivs_sequences_base_code ON ivs_sequences (base_code);
+CREATE INDEX IF NOT EXISTS ivs_sequences_mj_name ON ivs_sequences (mj_name);
+
+-- IVSシーケンス → PUAコード
+CREATE TABLE IF NOT EXISTS pua_allocations (
+    ivs_sequence TEXT PRIMARY KEY,
+    pua_code INTEGER NOT NULL UNIQUE,
+    pua_plane TEXT NOT NULL,
+    vs_name TEXT,
+    base_char TEXT,
+    mj_number TEXT
+);
+CREATE INDEX IF NOT EXISTS pua_allocations_plane ON pua_allocations (pua_plane);
+CREATE INDEX IF NOT EXISTS pua_allocations_vs_name ON pua_allocations (vs_name);
+"""
+
+def connect_catalog(path=DEFAULT_CATALOG_FILE):
+    """カタログを開く（なければスキーマを作成、古いスキーマなら作り直す）"""
+    conn = sqlite3.connect(path)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version != SCHEMA_VERSION:
+        with conn:
+            for table in _TABLES:
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.executescript(SCHEMA)
+    return conn
+
+def catalog_is_current(catalog_file=DEFAULT_CATALOG_FILE, json_file=DEFAULT_F_TO_C_FILE):
+    """カタログがF→Cマッピング（JSON）と同じ解析以降に書き込まれていれば True"""
+    try:
+        return os.path.getmtime(catalog_file) >= os.path.getmtime(json_file)
+    except OSError:
+        # JSONがなければカタログだけで足りる
+        return os.path.exists(catalog_file)
+
+def read_meta(conn):
+    """meta テーブルの キー → 値"""
+    return dict(conn.execute("SELECT key, value FROM meta"))
+
+def entry_hash(entry):
+    """D列キー1件分の内容ハッシュ（C列の並び順も含む）"""
+    encoded = json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+def _mj_rows(d_key, entry):
+    for c_order, (c_value, f_value) in enumerate(entry["C_values_with_F"].items()):
+        yield d_key, c_order, entry["B_value"], c_value, f_value
+
+def _ivs_rows(d_key, f_to_c_entry):
+    for entry_seq, record in enumerate(iter_ivs_records({d_key: f_to_c_entry})):
+        yield (d_key, entry_seq, record.ivs_sequence, record.unicode_code, record.vs_index,
+               record.vs_name, record.mj_name)
+
+def write_ingest(conn, result, f_to_c, source=None):
+    """解析結果（C→F）とF→Cマッピングをカタログに反映する
+
+    内容ハッシュが変わったD列キーのMJ行・IVSシーケンスだけを書き換え、
+    {'changed': 件数, 'removed': 件数, 'unchanged': 件数, 'revision': 取り込み番号} を
+    返します。取り込み番号（meta の ingest_revision）は何かが変わったときだけ
+    増えるため、後段は番号が同じなら前回の結果をそのまま使えます。
+    """
+    stored = {d_key: (entry_order, content_hash) for d_key, entry_order, content_hash
+              in conn.execute("SELECT d_key, entry_order, content_hash FROM entries")}
+
+    changed = []
+    entry_rows = []
+    for entry_order, (d_key, entry) in enumerate(result.items()):
+        content_hash = entry_hash(entry)
+        previous = stored.pop(d_key, None)
+        if previous is None or previous[1] != content_hash:
+            changed.append(d_key)
+        if previous != (entry_order, content_hash):
+            entry_rows.append((d_key, entry_order, content_hash))
+    removed = list(stored)
+
+    stale = [(d_key,) for d_key in changed + removed]
+    revision = int(read_meta(conn).get("ingest_revision") or 0)
+    if changed or removed or entry_rows or not revision:
+        revision += 1
+    with conn:
+        conn.executemany("DELETE FROM entries WHERE d_key = ?", [(d_key,) for d_key in removed])
+        conn.executemany("DELETE FROM mj_rows WHERE d_key = ?", stale)
+        conn.executemany("DELETE FROM ivs_sequences WHERE d_key = ?", stale)
+        conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", entry_rows)
+        for d_key in changed:
+            conn.executemany("INSERT INTO mj_rows VALUES (?, ?, ?, ?, ?)",
+                             _mj_rows(d_key, result[d_key]))
+            if d_key in f_to_c:
+                conn.executemany("INSERT INTO ivs_sequences VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 _ivs_rows(d_key, f_to_c[d_key]))
+        if source is not None:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('source', ?)", (source,))
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('ingest_revision', ?)", (str(revision),))
+
+    return {"changed": len(changed), "removed": len(removed),
+            "unchanged": len(result) - len(changed), "revision": revision}
+
+def write_pua_allocations(conn, pua_allocation_map, meta=None):
+    """PUA配置（ivs_sequence → {'pua_code', 'pua_plane', ...}）をカタログに反映する
+
+    保存済みの配置と異なる行だけを書き換え、書き換えた行数と削除した行数を返します。
+    meta（キー → 値）は同じトランザクションで meta テーブルに書き込みます。
+    """
+    stored = {row[0]: row for row in conn.execute(
+        "SELECT ivs_sequence, pua_code, pua_plane, vs_name, base_char, mj_number FROM pua_allocations")}
+
+    rows = []
+    for ivs_sequence, info in pua_allocation_map.items():
+        row = (ivs_sequence, info['pua_code'], info['pua_plane'], info.get('vs_name'),
+               info.get('base_char'), info.get('mj_number'))
+        if stored.pop(ivs_sequence, None) != row:
+            rows.append(row)
+    removed = list(stored)
+
+    with conn:
+        # pua_code の一意制約に触れないよう、先に古い行を消してから書き込む
+        conn.executemany("DELETE FROM pua_allocations WHERE ivs_sequence = ?",
+                         [(ivs_sequence,) for ivs_sequence in removed] + [(row[0],) for row in rows])
+        conn.executemany("INSERT INTO pua_allocations VALUES (?, ?, ?, ?, ?, ?)", rows)
+        if meta:
+            conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", meta.items())
+    return len(rows), len(removed)
+
+def iter_ivs_sequences(conn, vs_name=None, base_code=None):
+    """IVSシーケンスを生成スクリプトと同じ順に返す（vs_name / base_code で絞り込み可）"""
+    query = ("SELECT s.ivs_sequence, s.base_code, s.selector_index, s.vs_name, s.mj_name"
+             " FROM ivs_sequences s JOIN entries e ON e.d_key = s.d_key")
+    conditions = []
+    params = []
+    if vs_name is not None:
+        conditions.append("s.vs_name = ?")
+        params.append(vs_name)
+    if base_code is not None:
+        conditions.append("s.base_code = ?")
+        params.append(base_code)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY e.entry_order, s.entry_seq"
+    return conn.execute(query, params)
+
+def iter_catalog_records(conn):
+    """IVSシーケンスを IVSRecord として生成スクリプトと同じ順に返す
+
+    取り込み番号と合わせて読む場合は read_meta(conn)['ingest_revision'] を
+    同じ接続で先に読んでください。
+    """
+    for _, base_code, selector_index, _, mj_name in iter_ivs_sequences(conn):
+        yield make_record(base_code, selector_index, mj_name)
+
+def vs_distribution(conn):
+    """VS別のIVSシーケンス数"""
+    return dict(conn.execute(
+        "SELECT vs_name, COUNT(*) FROM ivs_sequences GROUP BY vs_name"))
+
+def find_mj_rows(conn, c_value):
+    """MJ文字図形名（C列）からMJ行を引く"""
+    return conn.execute(
+        "SELECT d_key, b_value, c_value, f_value FROM mj_rows WHERE c_value = ?",
+        (c_value,)).fetchall()
+
+def lookup_pua(conn, ivs_sequence):
+    """IVSシーケンスのPUAコード（未割り当てなら None）"""
+    row = conn.execute(
+        "SELECT pua_code FROM pua_allocations WHERE ivs_sequence = ?",
+        (ivs_sequence,)).fetchone()
+    return row[0] if row else None
+
+def iter_pua_allocations(conn, pua_plane=None):
+    """PUA配置を pua_code 順に返す（pua_plane で絞り込み可）"""
+    query = ("SELECT ivs_sequence, pua_code, pua_plane, vs_name, base_char, mj_number"
+             " FROM pua_allocations")
+    params = []
+    if pua_plane is not None:
+        query += " WHERE pua_plane = ?"
+        params.append(pua_plane)
+    query += " ORDER BY pua_code"
+    return conn.execute(query, params)
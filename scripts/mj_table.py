@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+MJ文字情報の解析結果を列指向で保持するコンパクトなテーブル
+
+parse_excel_with_f_column() の結果（D列キー → {"B_value", "C_values",
+"C_values_with_F"} の dict）を、整数配列と重複排除した文字列プールに
+詰め替えます。U+XXXX のキー、MJ文字図形名（MJ068055）、F列の値
+（3404_E0102）は整数として typed array に格納し、形式に合わない値だけを
+文字列プールに残します。参照時は元と同じ dict を組み立てて返します。
+"""
+import re
+import sys
+import pickle
+from array import array
+from collections.abc import Mapping
+
+# 値の符号化: 0以上は各列の数値表現、負の値 -(i + 1) は文字列プールの i 番目
+_D_PATTERN = re.compile(r'U\+([0-9A-F]{4,6})')
+_C_PATTERN = re.compile(r'MJ(\d{6})')
+_F_PATTERN = re.compile(r'([0-9A-F]{4,6})_E01([0-9A-F]{2})')
+
+DEFAULT_TABLE_FILE = "../mji_table.pickle"
+
+def _encode_d(value):
+    match = _D_PATTERN.fullmatch(value) if isinstance(value, str) else None
+    if match:
+        code = int(match.group(1), 16)
+        if _decode_d(code) == value:
+            return code
+    return None
+
+def _decode_d(code):
+    return f"U+{code:04X}"
+
+def _encode_c(value):
+    match = _C_PATTERN.fullmatch(value) if isinstance(value, str) else None
+    return int(match.group(1)) if match else None
+
+def _decode_c(code):
+    return f"MJ{code:06d}"
+
+def _encode_f(value):
+    """'3404_E0102' → (0x3404 << 8) | 0x02"""
+    match = _F_PATTERN.fullmatch(value) if isinstance(value, str) else None
+    if match:
+        code = (int(match.group(1), 16) << 8) | int(match.group(2), 16)
+        if _decode_f(code) == value:
+            return code
+    return None
+
+def _decode_f(code):
+    return f"{code >> 8:04X}_E01{code & 0xFF:02X}"
+
+class MJTable(Mapping):
+    """D列キーで引ける読み取り専用の列指向MJテーブル"""
+
+    def __init__(self):
+        self._pool = []          # 数値化できない値（intern済み文字列、None）
+        self._pool_index = {}
+        self._keys = array('l')  # D列キー
+        self._b_values = array('l')
+        self._c_start = array('l', [0])  # キーごとのC値の開始位置
+        self._c_values = array('l')
+        self._f_values = array('l')
+        self._key_index = None
+
+    @classmethod
+    def from_result(cls, result):
+        """parse_excel_with_f_column() の結果からテーブルを作成"""
+        table = cls()
+        for d_key, entry in result.items():
+            table._append(d_key, entry)
+        return table
+
+    def _pooled(self, value):
+        if isinstance(value, str):
+            value = sys.intern(value)
+        position = self._pool_index.get(value)
+        if position is None:
+            position = len(self._pool)
+            self._pool.append(value)
+            self._pool_index[value] = position
+        return -(position + 1)
+
+    def _encode(self, value, encoder):
+        code = encoder(value)
+        return code if code is not None else self._pooled(value)
+
+    def _decode(self, code, decoder):
+        return decoder(code) if code >= 0 else self._pool[-code - 1]
+
+    def _append(self, d_key, entry):
+        self._keys.append(self._encode(d_key, _encode_d))
+        self._b_values.append(self._pooled(entry["B_value"]))
+
+        c_with_f = entry.get("C_values_with_F", {})
+        for c_value in entry["C_values"]:
+            self._c_values.append(self._encode(c_value, _encode_c))
+            self._f_values.append(self._encode(c_with_f.get(c_value), _encode_f))
+        self._c_start.append(len(self._c_values))
+        self._key_index = None
+
+    def _position(self, d_key):
+        if self._key_index is None:
+            self._key_index = {key: i for i, key in enumerate(self)}
+        return self._key_index[d_key]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        for code in self._keys:
+            yield self._decode(code, _decode_d)
+
+    def __getitem__(self, d_key):
+        return self._entry(self._position(d_key))
+
+    def _entry(self, position):
+        start, end = self._c_start[position], self._c_start[position + 1]
+        c_values = [self._decode(code, _decode_c) for code in self._c_values[start:end]]
+        f_values = [self._decode(code, _decode_f) for code in self._f_values[start:end]]
+        return {
+            "B_value": self._pool[-self._b_values[position] - 1],
+            "C_values": c_values,
+            "C_values_with_F": dict(zip(c_values, f_values)),
+        }
+
+    def items(self):
+        # 位置で直接デコードし、キー索引を作らずに全件を走査する
+        for position, d_key in enumerate(self):
+            yield d_key, self._entry(position)
+
+    def values(self):
+        for position in range(len(self)):
+            yield self._entry(position)
+
+    def to_dict(self):
+        """parse_excel_with_f_column() と同じ形の dict に戻す"""
+        return dict(self.items())
+
+    def save(self, path=DEFAULT_TABLE_FILE):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __getstate__(self):
+        # 索引は再構築できるので保存しない
+        state = self.__dict__.copy()
+        state["_pool_index"] = None
+        state["_key_index"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pool = [sys.intern(v) if isinstance(v, str) else v for v in self._pool]
+        self._pool_index = {value: i for i, value in enumerate(self._pool)}
+
+def load_mj_table(path=DEFAULT_TABLE_FILE):
+    """parse_excel_with_f_column.py が保存したテーブルを読み込む"""
+    with open(path, 'rb') as f:
+        table = pickle.load(f)
+    if not isinstance(table, MJTable):
+        raise TypeError(f"{path} は MJTable ではありません")
+    return table
@@ -2,177 +2,855 @@
 import zipfile
 import xml.etree.ElementTree as ET
 import json
+import re
+import os
+import html
+import hashlib
+import pickle
+import argparse
+import io
+import csv
+import sys
+import time
+import multiprocessing
+from array import array
 from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
 
-def parse_excel_with_f_column(filename):
-    """Parse Excel file including F column mapping"""
+from mj_table import MJTable, DEFAULT_TABLE_FILE
+from reverse_c_f_mapping import reverse_entries
+from ivs_binary import write_ivs_binary, DEFAULT_BINARY_FILE
+from json_io import write_json, default_profile, PROFILES
+from mj_catalog import connect_catalog, write_ingest, DEFAULT_CATALOG_FILE
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Columns read from the MJ sheet: B, C (MJ figure name), D (UCS key), F (IVS)
+MJ_COLUMNS = ('B', 'C', 'D', 'F')
+
+# Bump whenever the parsed table for the same workbook would change
+PARSER_VERSION = 1
+
+# Parsed tables are cached here, keyed on the workbook fingerprint
+DEFAULT_CACHE_DIR = "../.cache/ingest"
+
+# Fingerprint and settings the intermediate outputs were last written for (in the cache dir)
+OUTPUT_STAMP_FILE = "outputs.json"
+
+SHEET_MEMBER = 'xl/worksheets/sheet1.xml'
+SHARED_STRINGS_MEMBER = 'xl/sharedStrings.xml'
+
+# One metrics record per run is appended here
+DEFAULT_METRICS_FILE = "../ingest_metrics.jsonl"
+
+class IngestMetrics:
+    """Phase timings and counters for one ingest run"""
     
-    # First, create a mapping from C values to F values
-    c_to_f_mapping = {}
-    result = defaultdict(lambda: {"B_value": None, "C_values": []})
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+        self._started = time.perf_counter()
+    
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
     
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+    
+    def record(self, **extra):
+        """Return the run as a JSON-serializable dict"""
+        total = time.perf_counter() - self._started
+        parse_seconds = self.phases.get("sheet_parse", 0.0)
+        rows = self.counters.get("rows_processed", 0)
+        
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "parser_version": PARSER_VERSION,
+            "phases_s": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "total_s": round(total, 4),
+            "rows_per_s": round(rows / parse_seconds, 1) if parse_seconds else None,
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+        record.update(self.counters)
+        record.update(extra)
+        return record
+
+def _peak_rss_mb():
+    """Peak resident set size of this process and its workers, in MiB"""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return round(peak * scale / (1 << 20), 1)
+
+def save_metrics(record, metrics_file=DEFAULT_METRICS_FILE):
+    """Append one metrics record as a JSON line"""
     try:
-        with zipfile.ZipFile(filename, 'r') as zip_ref:
-            # Read shared strings
-            shared_strings = []
-            try:
-                shared_strings_xml = zip_ref.read('xl/sharedStrings.xml')
-                ss_root = ET.fromstring(shared_strings_xml)
+        with open(metrics_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"Ingest metrics appended to {metrics_file}")
+    except Exception as e:
+        print(f"Error saving metrics: {e}")
+
+class _TimedReader:
+    """File wrapper that charges time spent in read() to a metrics phase"""
+    
+    def __init__(self, fileobj, metrics, phase):
+        self._fileobj = fileobj
+        self._metrics = metrics
+        self._phase = phase
+    
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self._fileobj.read(size)
+        self._metrics.add(self._phase, time.perf_counter() - start)
+        return data
+
+class SharedStrings:
+    """Lazily decoded view of xl/sharedStrings.xml
+    
+    The raw XML is kept as bytes and only the start offset of every <si>
+    entry is indexed up front. An entry is decoded the first time it is
+    looked up and memoized, so strings that no projected cell refers to
+    are never turned into Python objects.
+    """
+    
+    _SI_START = re.compile(rb'<(?:[\w.-]+:)?si[\s>/]')
+    # First <t> with text inside an entry (same rule as the old ElementTree walk)
+    _FIRST_TEXT = re.compile(rb'<(?:[\w.-]+:)?t(?:\s[^>]*)?(?<!/)>([^<]+)<')
+    
+    def __init__(self, xml_bytes):
+        start = time.perf_counter()
+        self._data = xml_bytes
+        self._offsets = array('q', (m.start() for m in self._SI_START.finditer(xml_bytes)))
+        self._cache = {}
+        # Time spent indexing and decoding entries, for IngestMetrics
+        self.decode_seconds = time.perf_counter() - start
+    
+    def __len__(self):
+        return len(self._offsets)
+    
+    def __getitem__(self, index):
+        try:
+            return self._cache[index]
+        except KeyError:
+            pass
+        
+        if not 0 <= index < len(self._offsets):
+            raise IndexError(f"shared string index out of range: {index}")
+        
+        started = time.perf_counter()
+        start = self._offsets[index]
+        end = self._offsets[index + 1] if index + 1 < len(self._offsets) else len(self._data)
+        match = self._FIRST_TEXT.search(self._data, start, end)
+        value = _decode_xml_text(match.group(1)) if match else ""
+        
+        self._cache[index] = value
+        self.decode_seconds += time.perf_counter() - started
+        return value
+
+def _decode_xml_text(raw):
+    """Decode raw XML character data the way an XML parser would"""
+    text = raw.decode('utf-8')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    if '&' in text:
+        text = html.unescape(text)
+    return text
+
+_ROOT_START = re.compile(rb'<([\w.-]+:)?worksheet[\s>][^>]*>')
+_ROW_START = re.compile(rb'<(?:[\w.-]+:)?row[\s>]')
+_SHEET_DATA_END = re.compile(rb'</(?:[\w.-]+:)?sheetData>')
+
+def _local_name(tag):
+    """Strip the XML namespace from an element tag"""
+    return tag.rsplit('}', 1)[-1]
+
+def _read_row(row_elem, shared_strings, columns=None):
+    """Return a {column letter: value} dict for one <row> element
+    
+    If columns is given, cells outside those columns are skipped before
+    their value is looked at, and the scan stops once every requested
+    column has been seen.
+    """
+    row_data = {}
+    wanted = len(columns) if columns is not None else 0
+    
+    # Cells are direct children of the row
+    for cell_elem in row_elem:
+        if not cell_elem.tag.endswith('c'):
+            continue
+        
+        # Extract column letter from cell reference (e.g. "AB12" -> "AB")
+        col_letter = cell_elem.get('r', '').rstrip('0123456789')
+        if columns is not None and col_letter not in columns:
+            continue
+        
+        cell_type = cell_elem.get('t', '')
+        
+        # Get cell value
+        for value_elem in cell_elem:
+            if value_elem.tag.endswith('v') and value_elem.text:
+                cell_value = value_elem.text
                 
-                # Extract shared strings
-                for si in ss_root.iter():
-                    if si.tag.endswith('si'):
-                        for t in si.iter():
-                            if t.tag.endswith('t') and t.text:
-                                shared_strings.append(t.text)
-                                break
-                        else:
-                            shared_strings.append("")
-                            
-                print(f"Found {len(shared_strings)} shared strings")
+                # If it's a shared string, look up the actual value
+                if cell_type == 's' and cell_value.isdigit():
+                    string_index = int(cell_value)
+                    if 0 <= string_index < len(shared_strings):
+                        cell_value = shared_strings[string_index]
                 
-            except Exception as e:
-                print(f"Error reading shared strings: {e}")
-                return None
-            
-            # Read worksheet data
-            sheet_xml = zip_ref.read('xl/worksheets/sheet1.xml')
-            sheet_root = ET.fromstring(sheet_xml)
-            
-            # Parse rows
-            rows_processed = 0
-            
-            # Find all row elements
-            all_rows = []
-            for elem in sheet_root.iter():
-                if elem.tag.endswith('row'):
-                    all_rows.append(elem)
+                row_data[col_letter] = cell_value
+                break
+        
+        if wanted and len(row_data) == wanted:
+            break
+    
+    return row_data
+
+def iter_sheet_rows(sheet_file, shared_strings, columns=None):
+    """Stream (row number, row data) pairs from a worksheet XML file object.
+    
+    Each <row> is decoded as soon as its end tag is parsed and then dropped
+    from the tree, so memory use does not grow with the size of the sheet.
+    Pass columns (e.g. MJ_COLUMNS) to only decode the cells that are used.
+    """
+    if columns is not None:
+        columns = frozenset(columns)
+    sheet_data = None
+    
+    for event, elem in ET.iterparse(sheet_file, events=('start', 'end')):
+        name = _local_name(elem.tag)
+        
+        if event == 'start':
+            if name == 'sheetData':
+                sheet_data = elem
+            continue
+        
+        if name != 'row':
+            continue
+        
+        row_num = int(elem.get('r', 0))
+        yield row_num, _read_row(elem, shared_strings, columns)
+        
+        # Release the finished row (and any earlier ones) from the tree
+        elem.clear()
+        if sheet_data is not None:
+            sheet_data.clear()
+
+def split_sheet_xml(sheet_xml, parts):
+    """Split worksheet XML into self-contained documents of whole <row>s
+    
+    Each piece keeps the original root start tag (and so its namespace
+    declarations) and contains a contiguous range of rows, in sheet order.
+    """
+    root_match = _ROOT_START.search(sheet_xml)
+    if root_match is None:
+        raise ValueError("worksheet root element not found")
+    root_open = root_match.group(0)
+    root_close = b'</' + (root_match.group(1) or b'') + b'worksheet>'
+    
+    row_starts = [m.start() for m in _ROW_START.finditer(sheet_xml)]
+    if not row_starts:
+        return []
+    
+    data_end = _SHEET_DATA_END.search(sheet_xml, row_starts[-1])
+    if data_end is None:
+        raise ValueError("</sheetData> not found after the last row")
+    
+    parts = max(1, min(parts, len(row_starts)))
+    step = -(-len(row_starts) // parts)
+    bounds = row_starts[::step] + [data_end.start()]
+    
+    return [root_open + sheet_xml[start:end] + root_close
+            for start, end in zip(bounds, bounds[1:])]
+
+_worker_shared_strings = None
+
+def _init_row_worker(shared_strings):
+    global _worker_shared_strings
+    _worker_shared_strings = shared_strings
+
+def _parse_row_range(args):
+    """Worker: decode every row of one split_sheet_xml() piece"""
+    piece, columns = args
+    return list(iter_sheet_rows(io.BytesIO(piece), _worker_shared_strings, columns))
+
+def iter_sheet_rows_parallel(sheet_xml, shared_strings, columns=None, workers=None):
+    """Like iter_sheet_rows(), but decodes row ranges on a process pool
+    
+    Ranges are handed back in sheet order, so callers see exactly the same
+    row sequence as with the serial reader. The whole sheet is held in
+    memory as bytes while the pool runs.
+    """
+    workers = workers or os.cpu_count() or 1
+    pieces = split_sheet_xml(sheet_xml, workers * 4)
+    
+    with multiprocessing.Pool(workers, initializer=_init_row_worker,
+                              initargs=(shared_strings,)) as pool:
+        for rows in pool.imap(_parse_row_range, ((piece, columns) for piece in pieces)):
+            yield from rows
+
+def _iter_workbook_rows(zip_ref, shared_strings, workers, metrics):
+    """Yield projected MJ rows from the workbook, serially or on a pool"""
+    if workers != 1:
+        with metrics.phase("unzip"):
+            sheet_xml = zip_ref.read(SHEET_MEMBER)
+        yield from iter_sheet_rows_parallel(sheet_xml, shared_strings, MJ_COLUMNS, workers)
+        return
+    
+    with zip_ref.open(SHEET_MEMBER) as sheet_file:
+        # Inflating the member happens inside read(), interleaved with parsing
+        timed_file = _TimedReader(sheet_file, metrics, "unzip")
+        yield from iter_sheet_rows(timed_file, shared_strings, MJ_COLUMNS)
+
+# Row readers
+#
+# Every reader is a generator read_rows(path, workers, metrics) that yields
+# (row number, {column letter: value}) pairs projected onto MJ_COLUMNS, with
+# empty cells left out and row 1 being the header. parse_excel_with_f_column()
+# runs the same aggregation over whichever reader matches the input.
+
+def read_xlsx_rows(path, workers, metrics):
+    """Rows of sheet1 in a zipped SpreadsheetML workbook"""
+    with zipfile.ZipFile(path, 'r') as zip_ref:
+        with metrics.phase("unzip"):
+            shared_strings_xml = zip_ref.read(SHARED_STRINGS_MEMBER)
+        
+        # Only entry offsets are indexed here; strings are decoded on lookup
+        shared_strings = SharedStrings(shared_strings_xml)
+        print(f"Found {len(shared_strings)} shared strings")
+        
+        try:
+            yield from _iter_workbook_rows(zip_ref, shared_strings, workers, metrics)
+        finally:
+            metrics.add("shared_strings", shared_strings.decode_seconds)
+
+def _sheet_xml_paths(path):
+    """Locate sheet XML and sharedStrings.xml for a pre-extracted workbook"""
+    if os.path.isdir(path):
+        return (os.path.join(path, *SHEET_MEMBER.split('/')),
+                os.path.join(path, *SHARED_STRINGS_MEMBER.split('/')))
+    
+    # A bare worksheet: look for sharedStrings.xml next to it or in xl/
+    sheet_dir = os.path.dirname(os.path.abspath(path))
+    for candidate in (sheet_dir, os.path.dirname(sheet_dir)):
+        shared_path = os.path.join(candidate, 'sharedStrings.xml')
+        if os.path.exists(shared_path):
+            return path, shared_path
+    return path, None
+
+def read_sheet_xml_rows(path, workers, metrics):
+    """Rows of an already extracted worksheet (a .xml file or an unzipped .xlsx directory)"""
+    sheet_path, shared_path = _sheet_xml_paths(path)
+    
+    shared_strings_xml = b''
+    if shared_path and os.path.exists(shared_path):
+        with open(shared_path, 'rb') as f:
+            shared_strings_xml = f.read()
+    shared_strings = SharedStrings(shared_strings_xml)
+    print(f"Found {len(shared_strings)} shared strings")
+    
+    try:
+        if workers != 1:
+            with open(sheet_path, 'rb') as f:
+                sheet_xml = f.read()
+            yield from iter_sheet_rows_parallel(sheet_xml, shared_strings, MJ_COLUMNS, workers)
+        else:
+            with open(sheet_path, 'rb') as sheet_file:
+                yield from iter_sheet_rows(sheet_file, shared_strings, MJ_COLUMNS)
+    finally:
+        metrics.add("shared_strings", shared_strings.decode_seconds)
+
+def _column_index(letters):
+    """Zero-based index of a column letter ("A" -> 0, "AA" -> 26)"""
+    index = 0
+    for letter in letters:
+        index = index * 26 + (ord(letter) - ord('A') + 1)
+    return index - 1
+
+def _read_delimited_rows(path, dialect_options):
+    projection = [(col, _column_index(col)) for col in MJ_COLUMNS]
+    
+    # utf-8-sig drops the BOM that spreadsheet exports tend to add
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row_num, fields in enumerate(csv.reader(f, **dialect_options), start=1):
+            width = len(fields)
+            yield row_num, {col: fields[index] for col, index in projection
+                            if index < width and fields[index]}
+
+def read_csv_rows(path, workers, metrics):
+    """Rows of a comma-separated export of the MJ sheet"""
+    return _read_delimited_rows(path, {})
+
+def read_tsv_rows(path, workers, metrics):
+    """Rows of a tab-separated export of the MJ sheet (no quoting)"""
+    return _read_delimited_rows(path, {'delimiter': '\t', 'quoting': csv.QUOTE_NONE})
+
+ROW_READERS = {
+    'xlsx': read_xlsx_rows,
+    'xml': read_sheet_xml_rows,
+    'csv': read_csv_rows,
+    'tsv': read_tsv_rows,
+}
+
+def detect_input_format(path):
+    """Pick a ROW_READERS key from the input path"""
+    if os.path.isdir(path):
+        return 'xml'
+    
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        return 'xlsx'
+    if extension == '.xml':
+        return 'xml'
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.tsv', '.tab', '.txt'):
+        return 'tsv'
+    raise ValueError(f"unrecognized MJ table format: {path}")
+
+def _add_row(result, c_to_f_mapping, reassigned_c_values, b_value, c_value, d_value, f_value):
+    """Fold one B/C/D/F row into the D-keyed result"""
+    # Create mapping from C to F
+    if c_value:
+        if c_to_f_mapping.get(c_value, f_value) != f_value:
+            reassigned_c_values.add(c_value)
+        c_to_f_mapping[c_value] = f_value
+    
+    # Use D as key
+    d_key = str(d_value)
+    entry = result[d_key]
+    
+    # Set B value (assuming it's consistent for same D key)
+    if entry["B_value"] is None:
+        entry["B_value"] = b_value
+    
+    # C_values_with_F doubles as an insertion-ordered set of C values,
+    # so the membership test is O(1) and F is filled in the same pass
+    if c_value:
+        c_with_f = entry["C_values_with_F"]
+        if c_value not in c_with_f:
+            entry["C_values"].append(c_value)
+        c_with_f[c_value] = f_value
+
+def parse_excel_with_f_column(filename, workers=1, metrics=None, input_format=None):
+    """Parse Excel file including F column mapping
+    
+    The input may be an .xlsx workbook, a CSV/TSV export or extracted sheet
+    XML; input_format (a ROW_READERS key) overrides detection by extension.
+    workers > 1 (or 0/None for one per CPU) parses sheet XML row ranges on a
+    process pool; the result is identical to the serial streaming pass.
+    Phase timings and row counts are recorded on metrics (an IngestMetrics).
+    """
+    if metrics is None:
+        metrics = IngestMetrics()
+    
+    # First, create a mapping from C values to F values
+    c_to_f_mapping = {}
+    result = defaultdict(lambda: {"B_value": None, "C_values": [], "C_values_with_F": {}})
+    # C values whose F value changed between rows (fixed up after the pass)
+    reassigned_c_values = set()
+    
+    try:
+        if input_format is None:
+            input_format = detect_input_format(filename)
+        read_rows = ROW_READERS[input_format]
+        
+        # Stream rows from the reader (or a worker pool for sheet XML)
+        rows_processed = 0
+        rows_seen = 0
+        
+        aggregation_seconds = 0.0
+        phases_before = sum(metrics.phases.values())
+        loop_start = time.perf_counter()
+        
+        for row_num, row_data in read_rows(filename, workers, metrics):
+            rows_seen += 1
             
-            print(f"Found {len(all_rows)} rows in worksheet")
+            # Skip header row
+            if row_num <= 1:
+                continue
             
-            for row_elem in all_rows:
-                row_num = int(row_elem.get('r', 0))
-                
-                # Skip header row
-                if row_num <= 1:
-                    continue
+            # Process this row if we have data for columns B, C, D, F
+            if 'B' in row_data and 'C' in row_data and 'D' in row_data and 'F' in row_data:
+                b_value = row_data['B']
+                c_value = row_data['C']
+                d_value = row_data['D']
+                f_value = row_data['F']
                 
-                # Get cell values for this row
-                row_data = {}
+                add_start = time.perf_counter()
+                _add_row(result, c_to_f_mapping, reassigned_c_values,
+                         b_value, c_value, d_value, f_value)
+                aggregation_seconds += time.perf_counter() - add_start
                 
-                # Find all cells in this row
-                for cell_elem in row_elem.iter():
-                    if cell_elem.tag.endswith('c'):
-                        cell_ref = cell_elem.get('r', '')
-                        cell_type = cell_elem.get('t', '')
-                        
-                        # Extract column letter from cell reference
-                        col_letter = ''.join(c for c in cell_ref if c.isalpha())
-                        
-                        # Get cell value
-                        for value_elem in cell_elem.iter():
-                            if value_elem.tag.endswith('v') and value_elem.text:
-                                cell_value = value_elem.text
-                                
-                                # If it's a shared string, look up the actual value
-                                if cell_type == 's' and cell_value.isdigit():
-                                    string_index = int(cell_value)
-                                    if 0 <= string_index < len(shared_strings):
-                                        cell_value = shared_strings[string_index]
-                                
-                                row_data[col_letter] = cell_value
-                                break
+                rows_processed += 1
                 
-                # Process this row if we have data for columns B, C, D, F
-                if 'B' in row_data and 'C' in row_data and 'D' in row_data and 'F' in row_data:
-                    b_value = row_data['B']
-                    c_value = row_data['C']
-                    d_value = row_data['D']
-                    f_value = row_data['F']
-                    
-                    # Create mapping from C to F
-                    if c_value:
-                        c_to_f_mapping[c_value] = f_value
-                    
-                    # Use D as key
-                    d_key = str(d_value)
+                # Print progress every 5000 rows
+                if rows_processed % 5000 == 0:
+                    print(f"Processed {rows_processed} rows...")
                     
-                    # Set B value (assuming it's consistent for same D key)
-                    if result[d_key]["B_value"] is None:
-                        result[d_key]["B_value"] = b_value
-                    
-                    # Add C value to array if it's not already there
-                    if c_value and c_value not in result[d_key]["C_values"]:
-                        result[d_key]["C_values"].append(c_value)
-                    
-                    rows_processed += 1
-                    
-                    # Print progress every 5000 rows
-                    if rows_processed % 5000 == 0:
-                        print(f"Processed {rows_processed} rows...")
-                        
-                    # Show first few rows for debugging
-                    if rows_processed <= 5:
-                        print(f"Row {row_num}: B='{b_value}', C='{c_value}', D='{d_value}', F='{f_value}'")
-            
-            print(f"Total rows processed: {rows_processed}")
-            print(f"Unique D keys found: {len(result)}")
-            print(f"C to F mappings created: {len(c_to_f_mapping)}")
-            
-            # Convert to regular dict
-            final_result = dict(result)
-            
-            # Now update the result to include F column mapping for C values
-            for key, value in final_result.items():
-                c_with_f = {}
-                for c_value in value["C_values"]:
-                    f_value = c_to_f_mapping.get(c_value, None)
-                    c_with_f[c_value] = f_value
-                
-                # Replace C_values array with C_values mapping
-                value["C_values_with_F"] = c_with_f
-                # Keep original array for backward compatibility
-                # value["C_values"] = list(c_with_f.keys())
-            
-            # Show sample
-            print("\\nSample results:")
-            for i, (key, value) in enumerate(final_result.items()):
-                if i >= 5:
-                    break
-                print(f"  Key '{key}': B='{value['B_value']}', C array length={len(value['C_values'])}")
-                print(f"    C values with F mapping: {value['C_values_with_F']}")
-            
-            return final_result, c_to_f_mapping
-            
+                # Show first few rows for debugging
+                if rows_processed <= 5:
+                    print(f"Row {row_num}: B='{b_value}', C='{c_value}', D='{d_value}', F='{f_value}'")
+    
+        # Whatever the reader did not charge to its own phases (unzip,
+        # shared_strings) and aggregation did not use is sheet parsing
+        loop_seconds = time.perf_counter() - loop_start
+        reader_seconds = sum(metrics.phases.values()) - phases_before
+        metrics.add("aggregation", aggregation_seconds)
+        metrics.add("sheet_parse", max(0.0, loop_seconds - aggregation_seconds - reader_seconds))
+        metrics.counters["rows_seen"] = rows_seen
+        metrics.counters["rows_processed"] = rows_processed
+        metrics.counters["d_keys"] = len(result)
+        
+        print(f"Found {rows_seen} rows in worksheet")
+        print(f"Total rows processed: {rows_processed}")
+        print(f"Unique D keys found: {len(result)}")
+        print(f"C to F mappings created: {len(c_to_f_mapping)}")
+        
+        # Convert to regular dict
+        final_result = dict(result)
+        
+        # A C value that appeared with several F values keeps the last one
+        # everywhere, as c_to_f_mapping does
+        if reassigned_c_values:
+            for value in final_result.values():
+                c_with_f = value["C_values_with_F"]
+                for c_value in reassigned_c_values.intersection(c_with_f):
+                    c_with_f[c_value] = c_to_f_mapping[c_value]
+        
+        # Show sample
+        print("\\nSample results:")
+        for i, (key, value) in enumerate(final_result.items()):
+            if i >= 5:
+                break
+            print(f"  Key '{key}': B='{value['B_value']}', C array length={len(value['C_values'])}")
+            print(f"    C values with F mapping: {value['C_values_with_F']}")
+        
+        return final_result, c_to_f_mapping
+        
     except Exception as e:
-        print(f"Error parsing Excel XML: {e}")
+        print(f"Error parsing MJ table: {e}")
         import traceback
         traceback.print_exc()
         return None, None
 
-def save_result(result, c_to_f_mapping, output_file, mapping_file):
-    """Save result to JSON files"""
+def fingerprint_workbook(filename, input_format=None):
+    """Hash the input contents together with the parser version and reader
+    
+    For an extracted workbook directory, the sheet and shared strings are
+    hashed in a fixed order. The resolved reader name is part of the hash,
+    so reading the same file with a different --format is a cache miss.
+    """
+    if input_format is None:
+        try:
+            input_format = detect_input_format(filename)
+        except ValueError:
+            # parse_excel_with_f_column reports the unrecognized format
+            input_format = "unknown"
+    digest = hashlib.sha256(f"parser-v{PARSER_VERSION}\0{input_format}\0".encode('utf-8'))
+    
+    if os.path.isdir(filename):
+        paths = [path for path in _sheet_xml_paths(filename) if path and os.path.exists(path)]
+    else:
+        paths = [filename]
+    
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def _cache_path(cache_dir, fingerprint):
+    return os.path.join(cache_dir, f"{fingerprint}.pickle")
+
+def load_cached_parse(fingerprint, cache_dir=DEFAULT_CACHE_DIR):
+    """Return the cached (result, c_to_f_mapping) for a fingerprint, or None"""
+    path = _cache_path(cache_dir, fingerprint)
+    if not os.path.exists(path):
+        return None
+    
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        print(f"Ignoring unreadable ingest cache {path}: {e}")
+        return None
+
+def save_cached_parse(fingerprint, result, c_to_f_mapping, cache_dir=DEFAULT_CACHE_DIR):
+    """Store a parsed table under its fingerprint"""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = _cache_path(cache_dir, fingerprint)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((result, c_to_f_mapping), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        print(f"Ingest cache saved to {path}")
+    except Exception as e:
+        print(f"Error saving ingest cache: {e}")
+
+def load_or_parse(filename, cache_dir=DEFAULT_CACHE_DIR, use_cache=True, workers=1, metrics=None,
+                  input_format=None):
+    """Parse the workbook, reusing the cached table if its fingerprint matches"""
+    if not use_cache:
+        return parse_excel_with_f_column(filename, workers, metrics, input_format)
+    
+    if metrics is None:
+        metrics = IngestMetrics()
+    
+    with metrics.phase("fingerprint"):
+        fingerprint = fingerprint_workbook(filename, input_format)
+    with metrics.phase("cache_load"):
+        cached = load_cached_parse(fingerprint, cache_dir)
+    metrics.counters["cache_hit"] = cached is not None
+    metrics.counters["fingerprint"] = fingerprint
+    if cached is not None:
+        print(f"Using cached parse of {filename} ({fingerprint[:12]})")
+        return cached
+    
+    result, c_to_f_mapping = parse_excel_with_f_column(filename, workers, metrics, input_format)
+    if result:
+        save_cached_parse(fingerprint, result, c_to_f_mapping, cache_dir)
+    return result, c_to_f_mapping
+
+def _stamp_path(cache_dir):
+    return os.path.join(cache_dir, OUTPUT_STAMP_FILE)
+
+def outputs_are_current(fingerprint, settings, outputs, cache_dir=DEFAULT_CACHE_DIR):
+    """True if every output exists and was last written from this fingerprint and settings"""
+    if fingerprint is None or not all(os.path.exists(path) for path in outputs):
+        return False
+    try:
+        with open(_stamp_path(cache_dir), 'r', encoding='utf-8') as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return stamp == {"fingerprint": fingerprint, "settings": settings}
+
+def clear_output_stamp(cache_dir=DEFAULT_CACHE_DIR):
+    """Forget the stamp before rewriting, so an interrupted write is never reused"""
+    try:
+        os.remove(_stamp_path(cache_dir))
+    except FileNotFoundError:
+        pass
+
+def save_output_stamp(fingerprint, settings, cache_dir=DEFAULT_CACHE_DIR):
+    """Record the fingerprint and settings of the outputs that were just written"""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(_stamp_path(cache_dir), 'w', encoding='utf-8') as f:
+            json.dump({"fingerprint": fingerprint, "settings": settings}, f)
+    except Exception as e:
+        print(f"Error saving output stamp: {e}")
+
+def _diff_entry(old_entry, new_entry):
+    """C-level difference between two versions of one D-key entry"""
+    old_c = old_entry["C_values_with_F"]
+    new_c = new_entry["C_values_with_F"]
+    
+    entry_delta = {
+        "B_value": new_entry["B_value"],
+        "C_added": {c: f for c, f in new_c.items() if c not in old_c},
+        "C_removed": {c: f for c, f in old_c.items() if c not in new_c},
+        "C_changed": {c: [old_c[c], f] for c, f in new_c.items() if c in old_c and old_c[c] != f},
+    }
+    if old_entry["B_value"] != new_entry["B_value"]:
+        entry_delta["B_value_before"] = old_entry["B_value"]
+    return entry_delta
+
+def diff_releases(old_result, new_result):
+    """Compare two parsed MJ releases, keyed by the D column
+    
+    Added and removed D keys carry their full entry; changed keys carry
+    only the C values that were added, removed or re-mapped to another F.
+    Key order follows the newer release (removed keys: the older one).
+    """
+    added = {}
+    changed = {}
+    for d_key, new_entry in new_result.items():
+        old_entry = old_result.get(d_key)
+        if old_entry is None:
+            added[d_key] = new_entry
+        elif old_entry != new_entry:
+            changed[d_key] = _diff_entry(old_entry, new_entry)
+    
+    removed = {d_key: entry for d_key, entry in old_result.items() if d_key not in new_result}
+    
+    return {"added": added, "removed": removed, "changed": changed}
+
+def save_delta(delta, previous_file, current_file, delta_file, profile=None):
+    """Save a diff_releases() result to JSON (profile as in save_result)"""
+    try:
+        output = {
+            "from": os.path.basename(previous_file),
+            "to": os.path.basename(current_file),
+            "summary": {kind: len(delta[kind]) for kind in ("added", "removed", "changed")},
+        }
+        output.update(delta)
+        
+        write_json(output, delta_file, profile)
+        print(f"Release delta saved to {delta_file}")
+        
+    except Exception as e:
+        print(f"Error saving delta: {e}")
+
+def save_ivs_binary(f_to_c, binary_file=DEFAULT_BINARY_FILE):
+    """Save the IVS records of the F -> C mapping in the packed binary format"""
+    try:
+        count = write_ivs_binary(f_to_c, binary_file)
+        print(f"IVS binary ({count} records) saved to {binary_file}")
+        return True
+    except Exception as e:
+        print(f"Error saving IVS binary: {e}")
+        return False
+
+def save_table(result, table_file=DEFAULT_TABLE_FILE):
+    """Save the result as a columnar MJTable (see mj_table.load_mj_table)"""
+    try:
+        MJTable.from_result(result).save(table_file)
+        print(f"Columnar table saved to {table_file}")
+        return True
+    except Exception as e:
+        print(f"Error saving table: {e}")
+        return False
+
+def save_catalog(result, f_to_c, catalog_file=DEFAULT_CATALOG_FILE, source=None):
+    """Load the MJ rows and IVS sequences into the SQLite catalog (see mj_catalog.py)
+    
+    Only D keys whose content hash changed since the last run are rewritten.
+    The JSON, binary and table outputs are still written in full.
+    """
+    try:
+        conn = connect_catalog(catalog_file)
+        try:
+            counts = write_ingest(conn, result, f_to_c, source=source)
+        finally:
+            conn.close()
+        print(f"Catalog saved to {catalog_file} "
+              f"({counts['changed']} changed, {counts['removed']} removed, "
+              f"{counts['unchanged']} unchanged D keys)")
+        return True
+    except Exception as e:
+        print(f"Error saving catalog: {e}")
+        return False
+
+def save_result(result, c_to_f_mapping, output_file, mapping_file, f_to_c=None, f_to_c_file=None,
+                profile=None):
+    """Save result to JSON files
+    
+    f_to_c_file receives f_to_c, the F -> C orientation consumed by the
+    generators (what reverse_c_f_mapping.py used to produce); output_file
+    may be None to skip the C -> F layout. profile picks the json_io
+    output profile (compact unless IVS_JSON_PROFILE says otherwise).
+    """
     try:
         # Save main result
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
-        print(f"Result saved to {output_file}")
+        if output_file:
+            write_json(result, output_file, profile)
+            print(f"Result saved to {output_file}")
+        
+        # Save the F -> C orientation straight from memory
+        if f_to_c_file:
+            write_json(f_to_c, f_to_c_file, profile)
+            print(f"F to C mapping saved to {f_to_c_file}")
         
         # Save C to F mapping
-        with open(mapping_file, 'w', encoding='utf-8') as f:
-            json.dump(c_to_f_mapping, f, ensure_ascii=False, indent=2)
+        write_json(c_to_f_mapping, mapping_file, profile)
         print(f"C to F mapping saved to {mapping_file}")
+        return True
         
     except Exception as e:
         print(f"Error saving result: {e}")
+        return False
 
 if __name__ == "__main__":
-    filename = "../ipa/mji.00602.xlsx"
-    result, c_to_f_mapping = parse_excel_with_f_column(filename)
+    parser = argparse.ArgumentParser(description="Parse the MJ character table (columns B, C, D, F)")
+    parser.add_argument("filename", nargs="?", default="../ipa/mji.00602.xlsx",
+                        help="MJ table to parse (.xlsx, .csv, .tsv, sheet .xml or extracted workbook dir)")
+    parser.add_argument("--format", choices=sorted(ROW_READERS), dest="input_format",
+                        help="input format (default: detect from the file extension)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always re-parse the workbook instead of using the ingest cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="directory for cached parse results")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="parse row ranges on N processes (0 = one per CPU)")
+    parser.add_argument("--previous", metavar="WORKBOOK",
+                        help="earlier MJ release to diff against; writes --delta-output")
+    parser.add_argument("--delta-output", default="../mji_delta.json",
+                        help="where to write the release delta (with --previous)")
+    parser.add_argument("--with-f-column-output", metavar="PATH",
+                        help="also write the C -> F layout (mji_analysis_with_f_column.json)")
+    parser.add_argument("--binary-output", default=DEFAULT_BINARY_FILE,
+                        help="where to write the packed F -> C IVS records")
+    parser.add_argument("--table-output", default=DEFAULT_TABLE_FILE,
+                        help="where to write the columnar MJTable pickle")
+    parser.add_argument("--json-profile", choices=PROFILES,
+                        help="format of the intermediate JSON files (default: compact; pretty for debugging)")
+    parser.add_argument("--catalog-output", default=DEFAULT_CATALOG_FILE,
+                        help="SQLite catalog that receives the MJ rows and IVS sequences")
+    parser.add_argument("--metrics-output", default=DEFAULT_METRICS_FILE,
+                        help="JSON Lines file that receives this run's metrics record")
+    args = parser.parse_args()
+    
+    metrics = IngestMetrics()
+    result, c_to_f_mapping = load_or_parse(args.filename, args.cache_dir,
+                                           use_cache=not args.no_cache, workers=args.workers,
+                                           metrics=metrics, input_format=args.input_format)
     
     if result:
-        # Save to JSON files
-        save_result(result, c_to_f_mapping, "../mji_analysis_with_f_column.json", "../c_to_f_mapping.json")
+        outputs = [path for path in (args.with_f_column_output, "../c_to_f_mapping.json",
+                                     "../mji_analysis_f_to_c_mapping.json", args.binary_output,
+                                     args.table_output, args.catalog_output) if path]
+        settings = {"json_profile": args.json_profile or default_profile(),
+                    "outputs": [os.path.abspath(path) for path in outputs]}
+        fingerprint = metrics.counters.get("fingerprint")
+        
+        if metrics.counters.get("cache_hit") and outputs_are_current(fingerprint, settings, outputs,
+                                                                      args.cache_dir):
+            # Same input, same outputs: leave the files (and their mtimes) alone
+            print("Intermediate outputs are up to date; skipping writes")
+            metrics.counters["outputs_skipped"] = True
+        else:
+            clear_output_stamp(args.cache_dir)
+            
+            # Save to JSON files
+            f_to_c = reverse_entries(result)
+            with metrics.phase("json_write"):
+                saved = save_result(result, c_to_f_mapping,
+                            args.with_f_column_output, "../c_to_f_mapping.json",
+                            f_to_c=f_to_c, f_to_c_file="../mji_analysis_f_to_c_mapping.json",
+                            profile=args.json_profile)
+            
+            # Packed, memory-mappable copy of the F -> C records (see ivs_binary.py)
+            with metrics.phase("binary_write"):
+                saved = save_ivs_binary(f_to_c, args.binary_output) and saved
+            
+            # Compact columnar copy for scripts that keep the whole table resident
+            with metrics.phase("table_write"):
+                saved = save_table(result, args.table_output) and saved
+            
+            # Indexed SQLite catalog shared with the PUA allocation step
+            with metrics.phase("catalog_write"):
+                saved = save_catalog(result, f_to_c, args.catalog_output,
+                                     source=os.path.basename(args.filename)) and saved
+            
+            if saved and fingerprint is not None:
+                save_output_stamp(fingerprint, settings, args.cache_dir)
+            metrics.counters["outputs_skipped"] = False
         
         # Print summary
         print(f"\\nFinal Summary:")
@@ -186,5 +864,22 @@ if __name__ == "__main__":
             if i >= 10:
                 break
             print(f"  {c_val} -> {f_val}")
+        
+        if args.previous:
+            previous_result, _ = load_or_parse(args.previous, args.cache_dir,
+                                               use_cache=not args.no_cache, workers=args.workers)
+            if previous_result:
+                delta = diff_releases(previous_result, result)
+                save_delta(delta, args.previous, args.filename, args.delta_output,
+                           profile=args.json_profile)
+                print(f"\nDelta vs {args.previous}: "
+                      f"{len(delta['added'])} added, {len(delta['removed'])} removed, "
+                      f"{len(delta['changed'])} changed D keys")
+            else:
+                print(f"Failed to parse previous release {args.previous}")
+        
+        record = metrics.record(input=os.path.basename(args.filename), workers=args.workers)
+        print(f"\nIngest metrics: {json.dumps(record, ensure_ascii=False)}")
+        save_metrics(record, args.metrics_output)
     else:
         print("Failed to parse Excel file")
\ No newline at end of file
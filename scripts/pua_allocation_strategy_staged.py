@@ -2,7 +2,55 @@
 """
 段階的PUA配置戦略の実装
 BMP PUA (0xE000-0xF8FF) と SMP PUA (0xF0000-) の二段階配置
+（15面が埋まれば16面 0x100000-0x10FFFD へ。予約範囲は PUAPlanner 参照）
+
+IVS→PUAの配置は allocate_pua_codes() だけが計算します。生成スクリプトは
+load_staged_pua_mapping() で配置表（staged_pua_mappings.json）を受け取り、
+入力のIVSレコードが変わっていなければ保存済みの配置表をそのまま使います。
 """
+import os
+import re
+import sys
+import copy
+import bisect
+import hashlib
+from collections import Counter, defaultdict
+
+DEFAULT_STAGED_PUA_FILE = "staged_pua_mappings.json"
+DEFAULT_LEDGER_FILE = "../pua_allocation_ledger.json"
+
+# 生成スクリプトの配置順（使用頻度降順）と、BMP PUAを優先するVS
+VS_PRIORITY = ["VS19", "VS18", "VS20", "VS17", "VS21", "VS22", "VS23", "VS24",
+               "VS25", "VS26", "VS27", "VS28", "VS29", "VS30", "VS31", "VS32"]
+BMP_PREFERRED_VS = ("VS19", "VS18", "VS20")
+
+# (VS名, BMP PUAを優先するか) の配置計画
+DEFAULT_VS_PLAN = [(vs_name, vs_name in BMP_PREFERRED_VS) for vs_name in VS_PRIORITY]
+
+# ビルドで使う配置方式（staged = VS優先度順、base / block = cluster_allocation_map、
+# frequency = コーパスの出現頻度順、frequency_allocation_map）
+POLICIES = ("staged", "base", "block", "frequency")
+
+def default_policy():
+    """IVS_PUA_POLICY が設定されていればその値、なければ 'staged'"""
+    policy = os.environ.get("IVS_PUA_POLICY", "staged")
+    if policy not in POLICIES:
+        raise ValueError(f"IVS_PUA_POLICY に未知の配置方式が指定されています: {policy}")
+    return policy
+
+def default_corpus():
+    """IVS_PUA_CORPUS（os.pathsep 区切りのファイル・ディレクトリ）のパスの列、なければ None"""
+    corpus = os.environ.get("IVS_PUA_CORPUS")
+    if not corpus:
+        return None
+    return [path for path in corpus.split(os.pathsep) if path]
+
+def default_ledger_file():
+    """ビルドで使う割り当て台帳（IVS_PUA_LEDGER=off なら None、別のパスならそのパス）"""
+    ledger_file = os.environ.get("IVS_PUA_LEDGER", DEFAULT_LEDGER_FILE)
+    if ledger_file.lower() in ("", "off", "0", "none"):
+        return None
+    return ledger_file
 
 def get_staged_pua_strategy():
     """段階的PUA配置戦略の定義"""
@@ -20,38 +68,243 @@ def get_staged_pua_strategy():
             "capacity": 65534,
             "description": "SMP Plane 15 Private Use Area - 残りの文字",
             "contains_vs": ["VS20_remaining", "VS17", "VS21", "VS22", "VS23", "VS24+"]
+        },
+        "smp_pua_p16": {
+            "start": 0x100000,
+            "end": 0x10FFFD,
+            "capacity": 65534,
+            "description": "SMP Plane 16 Private Use Area - 15面に入りきらない文字"
         }
     }
 
-def analyze_vs_distribution(stats_file="static_font_test_stats.json"):
-    """VS分布を分析してBMP PUA配置計画を作成"""
-    import json
+# 割り当てに使うPUA領域（平面名, 開始, 終了）。前の平面が埋まると次の平面へ溢れる
+PUA_PLANES = (
+    ('BMP', 0xE000, 0xF8FF),
+    ('SMP_P15', 0xF0000, 0xFFFFD),
+    ('SMP_P16', 0x100000, 0x10FFFD),
+)
+
+DEFAULT_RESERVED_FILE = "../pua_reserved_ranges.json"
+
+class PUACapacityError(Exception):
+    """PUA領域に割り当てきれない（フォントを生成する前にビルドを止める）"""
+
+def plan_capacity(demand, reserved_ranges=()):
+    """demand（希望する平面 → 文字数）を割り当てた場合の PUAPlanner を返す
+
+    収まらなければ PUACapacityError になります。
+    """
+    planner = PUAPlanner(reserved_ranges)
+    planner.check(demand)
+    for plane, _, _ in planner.planes:
+        for _ in range(demand.get(plane, 0)):
+            planner.take(plane)
+    return planner
+
+def load_reserved_ranges(reserved_file=DEFAULT_RESERVED_FILE):
+    """割り当てに使わない予約範囲を読み込む（ファイルがなければ空）
+
+    ファイルは [{"start": "0xE000", "end": "0xE0FF", "label": "自社外字"}, ...]
+    の形式で、start / end は整数か '0x' 付きの文字列です。
+    """
+    from json_io import load_json
+    
+    if not reserved_file or not os.path.exists(reserved_file):
+        return []
+    
+    reserved_ranges = []
+    for item in load_json(reserved_file):
+        start, end = (value if isinstance(value, int) else int(value, 0)
+                      for value in (item['start'], item['end']))
+        if start > end:
+            raise ValueError(f"{reserved_file} の予約範囲が逆順です: 0x{start:X}-0x{end:X}")
+        reserved_ranges.append((start, end))
+    return reserved_ranges
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+class PUAPlanner:
+    """BMP・15面・16面のPUAコードを予約範囲を避けて小さい順に払い出す
+
+    take(plane) は指定した平面から、埋まっていれば後ろの平面から次の空きコードを
+    返します。check(demand) で割り当ての前に容量を確認でき、足りなければ
+    PUACapacityError になります。skip_to() で飛ばしたコードは使われません。
+    """
+
+    def __init__(self, reserved_ranges=(), planes=PUA_PLANES):
+        self.planes = planes
+        self.reserved = _merge_ranges(reserved_ranges)
+        self._reserved_starts = [start for start, _ in self.reserved]
+        self._cursors = {plane: start for plane, start, _ in planes}
+        self.used = Counter()
+        self.skipped = Counter()
+        self.capacity = {plane: end - start + 1 - self._reserved_count(start, end)
+                         for plane, start, end in planes}
+
+    def _reserved_count(self, start, end):
+        return sum(max(0, min(end, r_end) - max(start, r_start) + 1)
+                   for r_start, r_end in self.reserved)
+
+    def is_reserved(self, code):
+        i = bisect.bisect_right(self._reserved_starts, code) - 1
+        return i >= 0 and code <= self.reserved[i][1]
+
+    def _plane_names(self, plane):
+        names = [name for name, _, _ in self.planes]
+        return names[names.index(plane):]
+
+    def free(self, plane):
+        return self.capacity[plane] - self.used[plane] - self.skipped[plane]
+
+    def _next_free(self, plane):
+        _, _, end = next(item for item in self.planes if item[0] == plane)
+        code = self._cursors[plane]
+        while code <= end:
+            i = bisect.bisect_right(self._reserved_starts, code) - 1
+            if i >= 0 and code <= self.reserved[i][1]:
+                code = self.reserved[i][1] + 1
+                continue
+            self._cursors[plane] = code + 1
+            return code
+        self._cursors[plane] = code
+        return None
+
+    def take(self, plane='BMP'):
+        """(平面名, PUAコード) を1つ払い出す"""
+        for name in self._plane_names(plane):
+            code = self._next_free(name)
+            if code is not None:
+                self.used[name] += 1
+                return name, code
+        raise PUACapacityError(f"{plane} 以降のPUA領域に空きがありません")
+
+    def peek(self, plane='BMP'):
+        """次に take(plane) で払い出される (平面名, PUAコード)"""
+        for name in self._plane_names(plane):
+            code = self._next_free(name)
+            if code is not None:
+                self._cursors[name] = code
+                return name, code
+        raise PUACapacityError(f"{plane} 以降のPUA領域に空きがありません")
+
+    def skip_to(self, plane, code):
+        """plane のカーソルを code まで進める（間のコードは使わない）"""
+        _, _, end = next(item for item in self.planes if item[0] == plane)
+        code = min(code, end + 1)
+        current = self._cursors[plane]
+        if code > current:
+            self.skipped[plane] += code - current - self._reserved_count(current, code - 1)
+            self._cursors[plane] = code
+
+    def check(self, demand):
+        """demand（希望する平面 → 文字数）が溢れを含めて収まるか確認する
+
+        前の平面から溢れた文字数を後ろの平面に繰り越し、最後の平面でも
+        溢れれば PUACapacityError になります。メッセージの「必要」「空き」は、
+        溢れが最後の平面まで続いている最初の平面以降の合計です。
+
+        >>> planner = PUAPlanner(planes=(('A', 0, 9), ('B', 10, 19)))
+        >>> try:
+        ...     planner.check({'A': 15, 'B': 12})
+        ... except PUACapacityError as e:
+        ...     print(e)
+        PUA領域が 7文字分足りません（A 以降: 必要 27文字, 空き 20文字）
+        """
+        names = [name for name, _, _ in self.planes]
+        unknown = set(demand) - set(names)
+        if unknown:
+            raise ValueError(f"未知のPUA平面です: {', '.join(sorted(unknown))}")
+        start = 0
+        overflow = 0
+        for i, name in enumerate(names):
+            overflow = max(0, demand.get(name, 0) + overflow - self.free(name))
+            if not overflow:
+                start = i + 1
+        if overflow:
+            wanted = sum(demand.get(name, 0) for name in names[start:])
+            available = sum(self.free(name) for name in names[start:])
+            raise PUACapacityError(
+                f"PUA領域が {overflow:,}文字分足りません"
+                f"（{names[start]} 以降: 必要 {wanted:,}文字, 空き {available:,}文字）")
+
+    def fill_report(self):
+        """平面ごとの容量・使用数・使用率"""
+        return [
+            {"plane": plane, "range": f"0x{start:04X}-0x{end:04X}",
+             "capacity": self.capacity[plane], "used": self.used[plane], "skipped": self.skipped[plane],
+             "fill": self.used[plane] / self.capacity[plane] if self.capacity[plane] else 0.0}
+            for plane, start, end in self.planes
+        ]
+
+    def print_report(self):
+        print("PUA使用状況:")
+        for row in self.fill_report():
+            skipped = f", 境界合わせで未使用 {row['skipped']:,}" if row['skipped'] else ""
+            print(f"  {row['plane']:<8} {row['range']:<17} {row['used']:>7,}/{row['capacity']:,}文字 ({row['fill']:.1%}{skipped})")
+        if self.reserved:
+            print(f"  予約範囲: {', '.join(f'0x{start:04X}-0x{end:04X}' for start, end in self.reserved)}")
+
+# 異体字セレクタ VS17-VS256 の範囲
+VS_SELECTOR_START = 0xE0100
+VS_SELECTOR_END = 0xE01EF
+
+def _is_known_selector(selector):
+    return VS_SELECTOR_START <= selector <= VS_SELECTOR_END
+
+def analyze_vs_distribution(ivs_characters=None, vs_plan=DEFAULT_VS_PLAN):
+    """VS分布を分析し、配置計画（vs_plan）でのBMP/SMP PUAの使用数を求める
+
+    ivs_characters（ivs_characters_from_records() の形式、省略時は
+    load_ivs_records() から作成）を1回走査してVS別の文字数を数え、
+    allocate_pua_codes() と同じ計画（既定はビルドで使う DEFAULT_VS_PLAN）で
+    各VSがBMP/SMPのどちらに入るかを見積もります。異体字セレクタの範囲外
+    （U+E01F0-U+E01FF など）のセレクタを持つIVSは unknown_selectors に、
+    計画にないVSは unplanned_vs に数え、どちらも配置されません。
+    """
+    if ivs_characters is None:
+        from ivs_records import load_ivs_records
+        ivs_characters = ivs_characters_from_records(load_ivs_records())
     
     try:
-        with open(stats_file, 'r', encoding='utf-8') as f:
-            stats = json.load(f)
-        
-        vs_distribution = stats.get('vs_distribution', {})
-        total_chars = stats.get('total_characters', 0)
+        vs_distribution = Counter()
+        unknown_selectors = Counter()
+        for char in ivs_characters:
+            selector = ord(char['ivs_sequence'][-1])
+            if _is_known_selector(selector):
+                vs_distribution[selector] += 1
+            else:
+                unknown_selectors[f"U+{selector:04X}"] += 1
+        total_chars = sum(vs_distribution.values())
         
         print("VS分布分析:")
         print("=" * 50)
         
-        # VS別の文字数を降順でソート
-        sorted_vs = sorted(vs_distribution.items(), key=lambda x: x[1], reverse=True)
+        vs_counts = {f"VS{selector - VS_SELECTOR_START + 17}": count
+                     for selector, count in sorted(vs_distribution.items())}
+        planned_vs = [(vs_name, prefer_bmp) for vs_name, prefer_bmp in vs_plan if vs_name in vs_counts]
+        unplanned_vs = {vs_name: count for vs_name, count in vs_counts.items()
+                        if vs_name not in dict(vs_plan)}
         
-        bmp_pua_capacity = 6400
+        bmp_pua_capacity = get_staged_pua_strategy()['bmp_pua']['capacity']
         bmp_allocation = []
         smp_allocation = []
         
         current_bmp_used = 0
         
-        for vs_name, count in sorted_vs:
-            if vs_name == "VS?":  # 不明なVSはスキップ
-                smp_allocation.append((vs_name, count, "unknown"))
-                continue
-                
-            if current_bmp_used + count <= bmp_pua_capacity:
+        # 配置計画の順に、BMP PUAを優先するVSはBMPに入る分だけBMPへ
+        for vs_name, prefer_bmp in planned_vs:
+            count = vs_counts[vs_name]
+            if not prefer_bmp:
+                smp_allocation.append((vs_name, count, "full"))
+                print(f"→ {vs_name}: {count:,}文字 → SMP PUA")
+            elif current_bmp_used + count <= bmp_pua_capacity:
                 # BMP PUAに全て配置可能
                 bmp_allocation.append((vs_name, count, "full"))
                 current_bmp_used += count
@@ -69,122 +322,793 @@ def analyze_vs_distribution(stats_file="static_font_test_stats.json"):
                 smp_allocation.append((vs_name, count, "full"))
                 print(f"→ {vs_name}: {count:,}文字 → SMP PUA")
         
+        for vs_name, count in unplanned_vs.items():
+            print(f"⚠ {vs_name}: {count:,}文字 (配置計画にないため配置しません)")
+        
+        if unknown_selectors:
+            print(f"⚠ 範囲外のセレクタ: {sum(unknown_selectors.values()):,}文字 (配置しません)")
+            for selector, count in sorted(unknown_selectors.items()):
+                print(f"    {selector}: {count:,}文字")
+        
         print(f"\n配置結果:")
         print(f"BMP PUA使用: {current_bmp_used:,}/{bmp_pua_capacity:,}文字")
         print(f"SMP PUA使用: {sum(count for _, count, _ in smp_allocation):,}文字")
         
         return {
+            "vs_counts": vs_counts,
+            "vs_order": [vs_name for vs_name, _ in planned_vs],
             "bmp_allocation": bmp_allocation,
             "smp_allocation": smp_allocation,
             "bmp_used": current_bmp_used,
             "smp_used": sum(count for _, count, _ in smp_allocation),
-            "total_chars": total_chars
+            "total_chars": total_chars,
+            "unknown_selectors": dict(unknown_selectors),
+            "unplanned_vs": unplanned_vs
         }
         
     except Exception as e:
         print(f"エラー: VS分布分析に失敗 - {e}")
         return None
 
-def generate_pua_allocation_map(ivs_characters):
-    """IVS文字に段階的PUAコードを割り当て"""
+def ivs_characters_from_records(records):
+    """ivs_records.IVSRecord の列から generate_pua_allocation_map 用の文字リストを作る"""
+    return [
+        {
+            'ivs_sequence': record.ivs_sequence,
+            'vs_name': record.vs_name,
+            'base_char': chr(record.unicode_code),
+            'mj_number': record.mj_name
+        }
+        for record in records
+    ]
+
+def _bucket_by_vs(ivs_characters):
+    """IVS文字を1回の走査でVS別に振り分ける（VS内の順序は維持）"""
+    buckets = defaultdict(list)
+    for char in ivs_characters:
+        buckets[char.get('vs_name')].append(char)
+    return buckets
+
+def _pua_entry(char, pua_code, pua_plane, vs_name):
+    return {
+        'pua_code': pua_code,
+        'pua_hex': f"U+{pua_code:04X}" if pua_plane == 'BMP' else f"U+{pua_code:05X}",
+        'pua_plane': pua_plane,
+        'vs_name': vs_name,
+        'base_char': char['base_char'],
+        'mj_number': char['mj_number']
+    }
+
+def generate_pua_allocation_map(ivs_characters, ledger_file=None, frequencies=None, reserved_ranges=(),
+                                cluster=None):
+    """IVS文字に段階的PUAコードを割り当て（ビルドと同じ DEFAULT_VS_PLAN を使用）
+
+    frequencies（IVSシーケンス → 出現回数、count_corpus_frequencies 参照）を
+    指定すると、VS単位ではなく出現頻度の高いIVSからBMP PUAに配置します。
+    cluster（"base" / "block"）を指定すると、同じ基底文字・CJKブロックの
+    異体字を連続したコードに配置します（cluster_allocation_map 参照）。
+    ledger_file を指定すると、割り当て台帳（apply_allocation_ledger 参照）で
+    既存のIVSのPUAコードを固定したうえで台帳を更新します。
+    reserved_ranges（(開始, 終了) の列）のコードは割り当てに使いません。
+    """
+    planner = PUAPlanner(reserved_ranges)
+    if frequencies is not None:
+        pua_allocation_map = frequency_allocation_map(ivs_characters, frequencies, planner)
+    elif cluster is not None:
+        pua_allocation_map = cluster_allocation_map(ivs_characters, cluster, planner)
+    else:
+        pua_allocation_map = allocate_pua_codes(ivs_characters, DEFAULT_VS_PLAN, planner)
     
-    # VS分布分析
-    analysis = analyze_vs_distribution()
-    if not analysis:
-        return None
+    if ledger_file:
+        ledger = load_allocation_ledger(ledger_file)
+        pua_allocation_map = apply_allocation_ledger(pua_allocation_map, ledger, reserved_ranges)
+        save_allocation_ledger(ledger, ledger_file)
     
-    # PUA配置の初期設定
-    bmp_pua_current = 0xE000
-    smp_pua_current = 0xF0000
+    return pua_allocation_map
+
+def allocate_pua_codes(ivs_characters, vs_plan=DEFAULT_VS_PLAN, planner=None):
+    """段階的PUA配置の共通エンジン
+
+    vs_plan の順にVSを処理し、BMP PUAを優先するVSはBMPに空きがある間はBMPへ、
+    それ以外（溢れた分を含む）は15面、15面も埋まれば16面へ、出てきた順に
+    割り当てます。vs_plan にないVSの文字は割り当てません。IVS文字は最初に1回
+    だけVS別のバケットに振り分けるため、処理量は文字数とVS数の和に比例します。
+
+    planner（PUAPlanner、予約範囲の指定用）は使用数が加算されます。割り当てる
+    前に容量を確認し、収まらなければ PUACapacityError になります。
+    """
+    if planner is None:
+        planner = PUAPlanner()
     
     pua_allocation_map = {}
+    buckets = _bucket_by_vs(ivs_characters)
+    
+    demand = Counter()
+    for vs_name, prefer_bmp in vs_plan:
+        demand['BMP' if prefer_bmp else 'SMP_P15'] += len(buckets.get(vs_name, ()))
+    planner.check(demand)
     
     print(f"\nPUAコード割り当て開始:")
     print("=" * 50)
     
-    # BMP PUA優先配置
-    for vs_name, count, allocation_type in analysis['bmp_allocation']:
-        vs_chars = [char for char in ivs_characters if char.get('vs_name') == vs_name]
-        
-        if allocation_type == "full":
-            # 全てBMP PUAに配置
-            for char in vs_chars:
-                pua_allocation_map[char['ivs_sequence']] = {
-                    'pua_code': bmp_pua_current,
-                    'pua_hex': f"U+{bmp_pua_current:04X}",
-                    'pua_plane': 'BMP',
-                    'vs_name': vs_name,
-                    'base_char': char['base_char'],
-                    'mj_number': char['mj_number']
-                }
-                bmp_pua_current += 1
-            print(f"✓ {vs_name}: {len(vs_chars):,}文字 → BMP PUA")
-            
-        elif allocation_type == "partial":
-            # 部分的にBMP PUAに配置
-            for i, char in enumerate(vs_chars):
-                if i < count:  # count分だけBMP PUAに配置
-                    pua_allocation_map[char['ivs_sequence']] = {
-                        'pua_code': bmp_pua_current,
-                        'pua_hex': f"U+{bmp_pua_current:04X}",
-                        'pua_plane': 'BMP',
-                        'vs_name': vs_name,
-                        'base_char': char['base_char'],
-                        'mj_number': char['mj_number']
-                    }
-                    bmp_pua_current += 1
-            print(f"⚠ {vs_name}: {count:,}文字 → BMP PUA (部分)")
-    
-    # SMP PUA配置
-    for vs_name, count, allocation_type in analysis['smp_allocation']:
-        if allocation_type == "remaining":
-            # VS20の残り分
-            vs_chars = [char for char in ivs_characters if char.get('vs_name') == vs_name]
-            allocated_count = len([seq for seq in pua_allocation_map if pua_allocation_map[seq]['vs_name'] == vs_name])
-            remaining_chars = vs_chars[allocated_count:]
-            
-            for char in remaining_chars:
-                pua_allocation_map[char['ivs_sequence']] = {
-                    'pua_code': smp_pua_current,
-                    'pua_hex': f"U+{smp_pua_current:05X}",
-                    'pua_plane': 'SMP_P15',
-                    'vs_name': vs_name,
-                    'base_char': char['base_char'],
-                    'mj_number': char['mj_number']
-                }
-                smp_pua_current += 1
-            print(f"→ {vs_name}: {len(remaining_chars):,}文字 → SMP PUA (残り)")
-            
-        else:
-            # 全てSMP PUAに配置
-            vs_chars = [char for char in ivs_characters if char.get('vs_name') == vs_name]
-            for char in vs_chars:
-                pua_allocation_map[char['ivs_sequence']] = {
-                    'pua_code': smp_pua_current,
-                    'pua_hex': f"U+{smp_pua_current:05X}",
-                    'pua_plane': 'SMP_P15',
-                    'vs_name': vs_name,
-                    'base_char': char['base_char'],
-                    'mj_number': char['mj_number']
-                }
-                smp_pua_current += 1
+    for vs_name, prefer_bmp in vs_plan:
+        vs_chars = buckets.get(vs_name)
+        if not vs_chars:
+            continue
+        
+        bmp_count = 0
+        for char in vs_chars:
+            pua_plane, pua_code = planner.take('BMP' if prefer_bmp else 'SMP_P15')
+            pua_allocation_map[char['ivs_sequence']] = _pua_entry(char, pua_code, pua_plane, vs_name)
+            if pua_plane == 'BMP':
+                bmp_count += 1
+        
+        if not prefer_bmp:
             print(f"→ {vs_name}: {len(vs_chars):,}文字 → SMP PUA")
+        elif bmp_count == len(vs_chars):
+            print(f"✓ {vs_name}: {bmp_count:,}文字 → BMP PUA")
+        else:
+            print(f"⚠ {vs_name}: {bmp_count:,}文字 → BMP PUA, {len(vs_chars) - bmp_count:,}文字 → SMP PUA")
+    
+    print(f"\n配置完了: {len(pua_allocation_map):,}文字")
+    planner.print_report()
+    
+    return pua_allocation_map
+
+def allocation_summary(pua_allocation_map):
+    """配置表の平面別（bmp / smp = 15面 / p16 = 16面）の文字数と、各平面の次に使うコード"""
+    return summarize_pua_codes(info['pua_code'] for info in pua_allocation_map.values())
+
+def summarize_pua_codes(pua_codes):
+    """PUAコードの列から allocation_summary() と同じ集計を作る
+
+    *_range は使用したコードの範囲の文字列で、割り当てのない平面では None です。
+    """
+    strategy = get_staged_pua_strategy()
+    summary = {
+        "bmp_start": strategy['bmp_pua']['start'],
+        "bmp_next": strategy['bmp_pua']['start'],
+        "bmp_allocated": 0,
+        "smp_start": strategy['smp_pua']['start'],
+        "smp_next": strategy['smp_pua']['start'],
+        "smp_allocated": 0,
+        "p16_start": strategy['smp_pua_p16']['start'],
+        "p16_next": strategy['smp_pua_p16']['start'],
+        "p16_allocated": 0,
+    }
+    planes = {'BMP': "bmp", 'SMP_P15': "smp", 'SMP_P16': "p16"}
+    for pua_code in pua_codes:
+        plane = planes[_plane_of(pua_code)]
+        summary[f"{plane}_allocated"] += 1
+        summary[f"{plane}_next"] = max(summary[f"{plane}_next"], pua_code + 1)
+    # 使用したコードの範囲（その平面に割り当てがなければ None）
+    for plane, width in (("bmp", 4), ("smp", 5), ("p16", 6)):
+        start, next_code = summary[f"{plane}_start"], summary[f"{plane}_next"]
+        summary[f"{plane}_range"] = (f"0x{start:0{width}X}-0x{next_code - 1:0{width}X}"
+                                     if summary[f"{plane}_allocated"] else None)
+    return summary
+
+def _source_hash(ivs_characters, plan_key, reserved_ranges=()):
+    """配置の入力（配置計画・予約範囲とIVS文字の並び）のハッシュ
+
+    plan_key は段階的配置の配置計画、クラスタ配置の (方式, シャードサイズ)、
+    または頻度順配置の (方式, 出現回数のハッシュ) です。
+    """
+    digest = hashlib.blake2b(repr((plan_key, _merge_ranges(reserved_ranges))).encode('utf-8'), digest_size=16)
+    for char in ivs_characters:
+        digest.update(f"{char['ivs_sequence']}\t{char['vs_name']}\t{char['mj_number']}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def _file_hash(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+def _frequency_hash(frequencies):
+    digest = hashlib.blake2b(digest_size=16)
+    for ivs_sequence, count in sorted(frequencies.items()):
+        digest.update(f"{ivs_sequence}\t{count}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def _catalog_pua_mapping(catalog_file, source_hash=None, ledger_hash=None):
+    """カタログのPUA配置を配置表として返す
+
+    source_hash を指定すると、同じハッシュで書き込まれた配置のときだけ返します（なければ None）。
+    """
+    from mj_catalog import connect_catalog, read_meta, iter_pua_allocations
+    
+    conn = connect_catalog(catalog_file)
+    try:
+        meta = read_meta(conn)
+        if source_hash is not None and (meta.get("pua_source_hash") != source_hash
+                                        or meta.get("pua_ledger_hash") != ledger_hash):
+            return None
+        return {
+            ivs_sequence: _pua_entry({'base_char': base_char, 'mj_number': mj_number},
+                                     pua_code, pua_plane, vs_name)
+            for ivs_sequence, pua_code, pua_plane, vs_name, base_char, mj_number in iter_pua_allocations(conn)
+        }
+    finally:
+        conn.close()
+
+def _catalog_records(catalog_file):
+    """カタログの (取り込み番号, IVSレコードの列)"""
+    from mj_catalog import connect_catalog, read_meta, iter_catalog_records
+    
+    conn = connect_catalog(catalog_file)
+    try:
+        return read_meta(conn).get("ingest_revision"), tuple(iter_catalog_records(conn))
+    finally:
+        conn.close()
+
+def _allocation_settings(ledger_file=None, reserved_file=DEFAULT_RESERVED_FILE, policy=None, corpus=None,
+                         catalog_file=None):
+    """IVSシーケンス以外の配置の入力を解決する
+
+    古いカタログ（catalog_is_current() でないもの）は catalog_file を None にします。
+    """
+    from mj_catalog import DEFAULT_CATALOG_FILE, catalog_is_current
+    
+    if catalog_file is None:
+        catalog_file = DEFAULT_CATALOG_FILE
+    if not catalog_is_current(catalog_file):
+        catalog_file = None
+    reserved_ranges = load_reserved_ranges(reserved_file)
+    if ledger_file is None:
+        ledger_file = default_ledger_file()
+    if policy is None:
+        policy = default_policy()
+    frequencies = None
+    if policy == "frequency":
+        if corpus is None:
+            corpus = default_corpus()
+        if not corpus:
+            raise ValueError("配置方式 frequency にはコーパス（IVS_PUA_CORPUS）が必要です")
+        frequencies = count_corpus_frequencies(corpus)
+    # staged のハッシュは配置方式を含めない（既存の配置表をそのまま使えるように）
+    if policy == "staged":
+        plan_key = DEFAULT_VS_PLAN
+    elif policy == "frequency":
+        plan_key = (policy, _frequency_hash(frequencies))
+    else:
+        plan_key = (policy, DEFAULT_SHARD_SIZE)
+    
+    return {
+        "catalog_file": catalog_file,
+        "reserved_ranges": reserved_ranges,
+        "ledger_file": ledger_file,
+        "policy": policy,
+        "frequencies": frequencies,
+        "plan_key": plan_key,
+        "settings_hash": hashlib.blake2b(repr((plan_key, _merge_ranges(reserved_ranges))).encode('utf-8'),
+                                         digest_size=16).hexdigest(),
+        "ledger_hash": _file_hash(ledger_file) if ledger_file else None,
+    }
+
+def _unchanged_allocation_token(settings):
+    """カタログの取り込み以降、保存済みの配置の入力が変わっていなければその識別子（なければ None）"""
+    from mj_catalog import connect_catalog, read_meta
+    
+    if not settings["catalog_file"]:
+        return None
+    conn = connect_catalog(settings["catalog_file"])
+    try:
+        meta = read_meta(conn)
+    finally:
+        conn.close()
+    revision = meta.get("ingest_revision")
+    if (revision is None or meta.get("pua_ingest_revision") != revision
+            or meta.get("pua_settings_hash") != settings["settings_hash"]
+            or meta.get("pua_ledger_hash") != settings["ledger_hash"]):
+        return None
+    return f"{revision}:{settings['settings_hash']}:{settings['ledger_hash']}"
+
+def allocation_token(ledger_file=None, reserved_file=DEFAULT_RESERVED_FILE, policy=None, corpus=None,
+                     catalog_file=None):
+    """カタログの取り込み以降に入力も設定も変わっていない配置の識別子（判定できなければ None）
+
+    引数は load_staged_pua_mapping() と同じで、IVSシーケンスも配置も読みません。
+    生成スクリプトは generated_output_is_current() でこの値を前回の出力と比べます。
+    """
+    return _unchanged_allocation_token(_allocation_settings(ledger_file, reserved_file, policy, corpus,
+                                                            catalog_file))
+
+def load_staged_pua_mapping(records=None, mapping_file=DEFAULT_STAGED_PUA_FILE, ledger_file=None,
+                            reserved_file=DEFAULT_RESERVED_FILE, policy=None, corpus=None, catalog_file=None):
+    """ビルドで使うIVS→PUA配置表を返す
+
+    records（IVSRecord の列）・配置計画・予約範囲・配置方式（policy、省略時は
+    default_policy()）のハッシュが保存済みの配置と一致すればそれを読み込み、
+    異なれば配置し直して mapping_file とカタログに保存します。
+    catalog_file（省略時は mj_catalog.DEFAULT_CATALOG_FILE）がF→Cマッピング
+    より新しければ、records を省略した場合のIVSシーケンスと保存済みの配置を
+    カタログから読みます。カタログの取り込み番号が前回の配置時から変わって
+    いなければ（allocation_token() 参照）、IVSシーケンスも読まずにカタログの
+    配置を返します。古いカタログは読まず、書き込みもしません
+    （records の省略時は load_ivs_records()、配置は mapping_file を使います）。
+    policy="frequency" では corpus（ファイル・ディレクトリの列、省略時は
+    default_corpus()）の出現回数で配置し、出現回数も一致の判定に含めます。
+    割り当て台帳（ledger_file、省略時は default_ledger_file()）を適用し、
+    台帳の内容も一致の判定に含めます。
+    PUA領域に収まらなければ、何も保存せずに PUACapacityError になります。
+    """
+    from json_io import load_json
+    
+    settings = _allocation_settings(ledger_file, reserved_file, policy, corpus, catalog_file)
+    catalog_file = settings["catalog_file"]
+    ledger_file = settings["ledger_file"]
+    policy = settings["policy"]
+    reserved_ranges = settings["reserved_ranges"]
+    saved_ledger_hash = settings["ledger_hash"]
+    
+    if records is None and _unchanged_allocation_token(settings) is not None:
+        cached = _catalog_pua_mapping(catalog_file)
+        print(f"✓ カタログのPUA配置を使用（取り込み以降変更なし）: {catalog_file} ({len(cached):,}文字)")
+        return cached
+    
+    revision = None
+    if records is None:
+        if catalog_file:
+            revision, records = _catalog_records(catalog_file)
+        else:
+            from ivs_records import load_ivs_records
+            records = load_ivs_records()
+    
+    ivs_characters = ivs_characters_from_records(records)
+    source_hash = _source_hash(ivs_characters, settings["plan_key"], reserved_ranges)
+    catalog_meta = {"pua_source_hash": source_hash, "pua_ledger_hash": saved_ledger_hash,
+                    "pua_ingest_revision": revision, "pua_settings_hash": settings["settings_hash"]}
+    
+    if catalog_file:
+        cached = _catalog_pua_mapping(catalog_file, source_hash, saved_ledger_hash)
+        if cached is not None:
+            print(f"✓ カタログのPUA配置を使用: {catalog_file} ({len(cached):,}文字)")
+            if revision is not None:
+                _save_catalog_meta(catalog_file, catalog_meta)
+            return cached
+    
+    if os.path.exists(mapping_file):
+        try:
+            saved = load_json(mapping_file)
+        except ValueError:
+            saved = {}
+        if saved.get("source_hash") == source_hash and saved.get("ledger_hash") == saved_ledger_hash:
+            print(f"✓ 保存済みのPUA配置を使用: {mapping_file} ({len(saved['mappings']):,}文字)")
+            if catalog_file:
+                _save_catalog_allocations(saved['mappings'], catalog_file, catalog_meta)
+            return saved['mappings']
+    
+    planner = PUAPlanner(reserved_ranges)
+    if policy == "staged":
+        pua_allocation_map = allocate_pua_codes(ivs_characters, planner=planner)
+    elif policy == "frequency":
+        pua_allocation_map = frequency_allocation_map(ivs_characters, settings["frequencies"], planner)
+    else:
+        pua_allocation_map = cluster_allocation_map(ivs_characters, policy, planner)
+    ledger_hash = None
+    if ledger_file:
+        ledger = load_allocation_ledger(ledger_file)
+        pua_allocation_map = apply_allocation_ledger(pua_allocation_map, ledger, reserved_ranges)
+        save_allocation_ledger(ledger, ledger_file)
+        ledger_hash = _file_hash(ledger_file)
+    
+    save_staged_pua_mapping(pua_allocation_map, mapping_file, catalog_file=catalog_file,
+                            source_hash=source_hash, ledger_hash=ledger_hash,
+                            ingest_revision=revision, settings_hash=settings["settings_hash"])
+    return pua_allocation_map
+
+# 生成物ごとのスタンプ（配置の識別子・生成スクリプト・出力のハッシュ）の置き場所
+DEFAULT_GENERATED_STAMP_DIR = "../.cache/generated"
+
+def _generated_stamp(output_file, token, generator_file):
+    return {"token": token, "generator": _file_hash(generator_file), "output": _file_hash(output_file)}
+
+def generated_output_is_current(output_file, token, generator_file, stamp_dir=DEFAULT_GENERATED_STAMP_DIR):
+    """output_file が同じ配置（allocation_token()）と同じ生成スクリプトから作られたままなら True
+
+    token が None（配置が変わったか判定できない）なら常に False です。
+    """
+    from json_io import load_json
+    
+    if token is None or not os.path.exists(output_file):
+        return False
+    try:
+        stamp = load_json(os.path.join(stamp_dir, os.path.basename(output_file) + ".json"))
+    except (OSError, ValueError):
+        return False
+    return stamp == _generated_stamp(output_file, token, generator_file)
+
+def record_generated_output(output_file, token, generator_file, stamp_dir=DEFAULT_GENERATED_STAMP_DIR):
+    """generated_output_is_current() 用のスタンプを書く（token が None なら何もしない）"""
+    from json_io import write_json
+    
+    if token is None:
+        return
+    os.makedirs(stamp_dir, exist_ok=True)
+    write_json(_generated_stamp(output_file, token, generator_file),
+               os.path.join(stamp_dir, os.path.basename(output_file) + ".json"), "compact")
+
+# IVS: 基底文字 + 異体字セレクタ (U+E0100-U+E01EF)
+_IVS_PATTERN = re.compile('[^\U000E0100-\U000E01EF][\U000E0100-\U000E01EF]')
+
+def _iter_corpus_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+def count_corpus_frequencies(paths):
+    """文書コーパス（ファイルまたはディレクトリ）中のIVSシーケンスの出現回数を数える
+
+    各ファイルをUTF-8テキストとして読み、デコードできないバイトは無視します。
+    """
+    frequencies = Counter()
+    for path in _iter_corpus_files(paths):
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                frequencies.update(_IVS_PATTERN.findall(line))
+    return frequencies
+
+def frequency_allocation_map(ivs_characters, frequencies, planner=None):
+    """出現頻度の高いIVSから順にBMP PUAへ、残りをSMP PUAへ配置
+
+    同じ頻度（コーパスに出てこないものを含む）は ivs_characters の順序を保ちます。
+    範囲外のセレクタを持つIVSは段階的配置と同じく割り当てません。
+    """
+    if planner is None:
+        planner = PUAPlanner()
+    
+    ordered = sorted((char for char in ivs_characters if _is_known_selector(ord(char['ivs_sequence'][-1]))),
+                     key=lambda char: -frequencies.get(char['ivs_sequence'], 0))
+    planner.check({'BMP': len(ordered)})
+    bmp_capacity = planner.free('BMP')
+    
+    pua_allocation_map = {}
+    for char in ordered:
+        pua_plane, pua_code = planner.take('BMP')
+        pua_allocation_map[char['ivs_sequence']] = _pua_entry(char, pua_code, pua_plane, char.get('vs_name'))
+    
+    covered = sum(frequencies.get(char['ivs_sequence'], 0) for char in ordered[:bmp_capacity])
+    total = sum(frequencies.get(char['ivs_sequence'], 0) for char in ordered)
+    print(f"\n頻度順配置: BMP PUA {min(len(ordered), bmp_capacity):,}文字, SMP PUA {max(len(ordered) - bmp_capacity, 0):,}文字")
+    if total:
+        print(f"コーパス出現のうちBMP PUAに入る割合: {covered / total:.1%} ({covered:,}/{total:,})")
+    
+    return pua_allocation_map
+
+def _encoded_size(pua_code):
+    """PUA文字1つの (UTF-16コード単位数, UTF-8バイト数)"""
+    return (1, 3) if pua_code <= 0xFFFF else (2, 4)
+
+def frequency_saving_report(frequencies, baseline_map, candidate_map):
+    """コーパスをPUAに置き換えた場合のサイズを2つの配置で比較する"""
+    sizes = {}
+    for label, pua_map in (("baseline", baseline_map), ("candidate", candidate_map)):
+        utf16_units = utf8_bytes = 0
+        for ivs_sequence, count in frequencies.items():
+            info = pua_map.get(ivs_sequence)
+            if info is None:
+                continue
+            units, octets = _encoded_size(info['pua_code'])
+            utf16_units += units * count
+            utf8_bytes += octets * count
+        sizes[label] = {"utf16_bytes": utf16_units * 2, "utf8_bytes": utf8_bytes}
+    
+    report = dict(sizes,
+                  occurrences=sum(count for ivs_sequence, count in frequencies.items()
+                                  if ivs_sequence in candidate_map),
+                  utf16_saving_bytes=sizes["baseline"]["utf16_bytes"] - sizes["candidate"]["utf16_bytes"],
+                  utf8_saving_bytes=sizes["baseline"]["utf8_bytes"] - sizes["candidate"]["utf8_bytes"])
+    
+    print(f"\n頻度順配置による見込みサイズ（IVS出現 {report['occurrences']:,}回）:")
+    for encoding in ("utf16", "utf8"):
+        before = sizes["baseline"][f"{encoding}_bytes"]
+        after = sizes["candidate"][f"{encoding}_bytes"]
+        saving = report[f"{encoding}_saving_bytes"]
+        ratio = saving / before if before else 0
+        print(f"  {encoding.upper()}: {before:,} → {after:,} バイト（{saving:,} バイト削減, {ratio:.1%}）")
+    
+    return report
+
+# フォントを分割する単位（unicode-range のシャード1つ分のコードポイント数）
+DEFAULT_SHARD_SIZE = 256
+
+CLUSTER_POLICIES = ("base", "block")
+
+# 基底文字のCJKブロック（名前, 開始, 終了）
+CJK_BLOCKS = (
+    ("CJK統合漢字拡張A", 0x3400, 0x4DBF),
+    ("CJK統合漢字", 0x4E00, 0x9FFF),
+    ("CJK互換漢字", 0xF900, 0xFAFF),
+    ("CJK統合漢字拡張B", 0x20000, 0x2A6DF),
+    ("CJK統合漢字拡張C", 0x2A700, 0x2B73F),
+    ("CJK統合漢字拡張D", 0x2B740, 0x2B81F),
+    ("CJK統合漢字拡張E", 0x2B820, 0x2CEAF),
+    ("CJK統合漢字拡張F", 0x2CEB0, 0x2EBEF),
+    ("CJK互換漢字補助", 0x2F800, 0x2FA1F),
+    ("CJK統合漢字拡張G", 0x30000, 0x3134F),
+)
+
+def cjk_block(code):
+    """基底文字のCJKブロック名（どれにも入らなければ 'その他'）"""
+    for name, start, end in CJK_BLOCKS:
+        if start <= code <= end:
+            return name
+    return "その他"
+
+def _cluster_layout(groups, planner, cluster, shard_size):
+    """グループごとに必要ならシャードの先頭まで飛ばし、(IVS文字, 平面名, PUAコード) を順に返す"""
+    for group in groups:
+        pua_plane, pua_code = planner.peek('BMP')
+        offset = pua_code % shard_size
+        if offset and (cluster == "block" or offset + len(group) > shard_size >= len(group)):
+            planner.skip_to(pua_plane, pua_code - offset + shard_size)
+        for char in group:
+            pua_plane, pua_code = planner.take('BMP')
+            yield char, pua_plane, pua_code
+
+def cluster_allocation_map(ivs_characters, cluster="base", planner=None, shard_size=DEFAULT_SHARD_SIZE):
+    """同じ基底文字・同じCJKブロックの異体字が連続したPUAコードになるように配置
+
+    IVS文字を基底文字のコードポイント順（同じ基底文字ならセレクタ順）に並べて
+    BMP PUAから順に割り当てます。
+    cluster="base"  基底文字ごとの異体字の並びがシャード（shard_size 単位の
+                    コード範囲）の境界をまたぐ場合は、次のシャードの先頭から始める
+    cluster="block" CJKブロックごとに次のシャードの先頭から始める
+    飛ばしたコードは使いません。範囲外のセレクタを持つIVSは割り当てません。
+    """
+    if cluster not in CLUSTER_POLICIES:
+        raise ValueError(f"未知のクラスタ単位です: {cluster}")
+    if planner is None:
+        planner = PUAPlanner()
+    
+    ordered = sorted((char for char in ivs_characters if _is_known_selector(ord(char['ivs_sequence'][-1]))),
+                     key=lambda char: (ord(char['base_char']), ord(char['ivs_sequence'][-1])))
+    
+    # 連続して配置する単位
+    groups = defaultdict(list)
+    for char in ordered:
+        key = char['base_char'] if cluster == "base" else cjk_block(ord(char['base_char']))
+        groups[key].append(char)
+    
+    # 境界合わせで飛ばすコードも需要に含めて容量を確認する（planner の写しで下書き配置）
+    draft = copy.deepcopy(planner)
+    try:
+        for _ in _cluster_layout(groups.values(), draft, cluster, shard_size):
+            pass
+    except PUACapacityError:
+        pass
+    padding = sum(draft.skipped.values()) - sum(planner.skipped.values())
+    planner.check({'BMP': len(ordered) + padding})
+    
+    pua_allocation_map = {}
+    for char, pua_plane, pua_code in _cluster_layout(groups.values(), planner, cluster, shard_size):
+        pua_allocation_map[char['ivs_sequence']] = _pua_entry(char, pua_code, pua_plane, char.get('vs_name'))
     
-    print(f"\n配置完了:")
-    print(f"BMP PUA: {bmp_pua_current - 0xE000:,}文字 (0xE000-0x{bmp_pua_current-1:04X})")
-    print(f"SMP PUA: {smp_pua_current - 0xF0000:,}文字 (0xF0000-0x{smp_pua_current-1:05X})")
-    print(f"総文字数: {len(pua_allocation_map):,}文字")
+    unit = "基底文字" if cluster == "base" else "CJKブロック"
+    print(f"\n{unit}ごとの連続配置: {len(groups):,}グループ, {len(pua_allocation_map):,}文字")
+    planner.print_report()
     
     return pua_allocation_map
 
-def save_staged_pua_mapping(pua_allocation_map, output_file="staged_pua_mappings.json"):
-    """段階的PUAマッピングをJSONファイルに保存"""
-    import json
+def corpus_documents(paths):
+    """文書コーパスの各ファイルで使われているIVSシーケンスの集合を順に返す"""
+    for path in _iter_corpus_files(paths):
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            sequences = set()
+            for line in f:
+                sequences.update(_IVS_PATTERN.findall(line))
+        if sequences:
+            yield sequences
+
+def family_documents(ivs_characters):
+    """基底文字ごとの異体字一式を1文書とみなした文書の列（コーパスがない場合の代用）"""
+    families = defaultdict(set)
+    for char in ivs_characters:
+        families[char['base_char']].add(char['ivs_sequence'])
+    return list(families.values())
+
+def shard_touch_report(documents, policy_maps, shard_size=DEFAULT_SHARD_SIZE):
+    """配置ごとに、1文書が表示に必要とするフォントシャードの数を集計する
+
+    シャードは PUAコード // shard_size で決まる unicode-range の区切りです。
+    policy_maps は 配置名 → 配置表 です。
+    """
+    documents = list(documents)
+    report = {}
+    for name, pua_map in policy_maps.items():
+        touched = sorted(len({pua_map[ivs_sequence]['pua_code'] // shard_size
+                              for ivs_sequence in document if ivs_sequence in pua_map})
+                         for document in documents)
+        touched = [count for count in touched if count]
+        if not touched:
+            report[name] = None
+            continue
+        report[name] = {
+            "documents": len(touched),
+            "mean": sum(touched) / len(touched),
+            "median": touched[len(touched) // 2],
+            "p95": touched[min(len(touched) - 1, int(len(touched) * 0.95))],
+            "max": touched[-1],
+            "total_shards": len({info['pua_code'] // shard_size for info in pua_map.values()}),
+        }
+    
+    print(f"\n1文書あたりのシャード数（シャード = {shard_size}コードポイント, {len(documents):,}文書）:")
+    for name, row in report.items():
+        if row is None:
+            print(f"  {name:<10} 対象の文書がありません")
+            continue
+        print(f"  {name:<10} 平均 {row['mean']:.2f}, 中央値 {row['median']}, 95% {row['p95']}, "
+              f"最大 {row['max']} (全 {row['total_shards']:,}シャード)")
+    
+    return report
+
+LEDGER_VERSION = 1
+
+# 台帳で管理するPUA領域（平面名, 開始, 終了）
+LEDGER_PLANES = PUA_PLANES
+
+def ledger_key(ivs_sequence):
+    """IVSシーケンスの台帳キー（F列と同じ '3404_E0102' 形式）"""
+    return "_".join(f"{ord(char):04X}" for char in ivs_sequence)
+
+def load_allocation_ledger(ledger_file=DEFAULT_LEDGER_FILE):
+    """割り当て台帳を読み込む（なければ空の台帳）
+
+    active はIVSシーケンス → 割り当て中のPUAコード、tombstones はデータから
+    消えたIVSシーケンス → 以前のPUAコードです。tombstone のコードは他のIVSに
+    再利用しません。
+    """
+    from json_io import load_json
+    
+    if not os.path.exists(ledger_file):
+        return {"version": LEDGER_VERSION, "active": {}, "tombstones": {}}
+    
+    ledger = load_json(ledger_file)
+    if ledger.get("version") != LEDGER_VERSION:
+        raise ValueError(f"{ledger_file} の台帳バージョン {ledger.get('version')} には対応していません")
+    return ledger
+
+def save_allocation_ledger(ledger, ledger_file=DEFAULT_LEDGER_FILE):
+    """割り当て台帳を保存（差分を追いやすいよう pretty 形式・キー順）"""
+    from json_io import write_json
+    
+    ledger = dict(ledger,
+                  active=dict(sorted(ledger["active"].items())),
+                  tombstones=dict(sorted(ledger["tombstones"].items())))
+    write_json(ledger, ledger_file, "pretty")
+    print(f"✓ 割り当て台帳を保存: {ledger_file}")
+
+def _plane_of(pua_code):
+    for plane, start, end in LEDGER_PLANES:
+        if start <= pua_code <= end:
+            return plane
+    return None
+
+def _free_codes(start, end, used, planner):
+    for code in range(start, end + 1):
+        if code not in used and not planner.is_reserved(code):
+            yield code
+
+def apply_allocation_ledger(pua_allocation_map, ledger, reserved_ranges=()):
+    """段階的配置の結果に台帳を適用し、既存のPUAコードを固定した配置を返す
+
+    - 台帳に active なIVSは以前のPUAコードをそのまま使う
+    - tombstone になっていたIVSが戻ってきたら以前のコードで復活させる
+    - 新しいIVSは、配置で決まったコードが空いていればそのまま使い、台帳の
+      コードと衝突した場合だけ同じ平面の空きコードを小さい順に使う
+      （空きがなければ後ろの平面へ。reserved_ranges のコードは使わない）
+    - 今回のデータにない active なIVSは tombstone にする
+    ledger はその場で更新されます。
+    """
+    active = ledger["active"]
+    tombstones = ledger["tombstones"]
+    used = set(active.values()) | set(tombstones.values())
+    
+    stable_map = {}
+    new_sequences = []
+    kept = revived = 0
+    seen = set()
+    
+    for ivs_sequence, info in pua_allocation_map.items():
+        key = ledger_key(ivs_sequence)
+        seen.add(key)
+        if key in active:
+            pua_code = active[key]
+            kept += 1
+        elif key in tombstones:
+            pua_code = tombstones.pop(key)
+            active[key] = pua_code
+            revived += 1
+        else:
+            new_sequences.append((ivs_sequence, info, key))
+            continue
+        stable_map[ivs_sequence] = dict(info, pua_code=pua_code)
+    
+    # 今回のデータにないIVSを tombstone に移す
+    retired = [key for key in active if key not in seen]
+    for key in retired:
+        tombstones[key] = active.pop(key)
+    
+    # 新しいIVSは配置で決まったコードが空いていればそれを使う
+    planner = PUAPlanner(reserved_ranges, LEDGER_PLANES)
+    collisions = []
+    for ivs_sequence, info, key in new_sequences:
+        pua_code = info['pua_code']
+        if pua_code in used or planner.is_reserved(pua_code) or _plane_of(pua_code) is None:
+            collisions.append((ivs_sequence, info, key))
+            continue
+        used.add(pua_code)
+        active[key] = pua_code
+        stable_map[ivs_sequence] = dict(info)
+    
+    # 衝突したIVSを希望の平面の空きコードに割り当て
+    free = {plane: _free_codes(start, end, used, planner) for plane, start, end in LEDGER_PLANES}
+    plane_order = [plane for plane, _, _ in LEDGER_PLANES]
+    for ivs_sequence, info, key in collisions:
+        preferred = plane_order.index(info['pua_plane']) if info['pua_plane'] in plane_order else 0
+        for plane in plane_order[preferred:]:
+            pua_code = next(free[plane], None)
+            if pua_code is not None:
+                break
+        else:
+            raise PUACapacityError(f"PUA領域に空きがありません: {key}")
+        active[key] = pua_code
+        stable_map[ivs_sequence] = dict(info, pua_code=pua_code)
+    
+    # コードから平面と表記を付け直し、コード順に並べる
+    for info in stable_map.values():
+        info['pua_plane'] = _plane_of(info['pua_code'])
+        info['pua_hex'] = f"U+{info['pua_code']:04X}" if info['pua_plane'] == 'BMP' else f"U+{info['pua_code']:05X}"
+    stable_map = dict(sorted(stable_map.items(), key=lambda item: item[1]['pua_code']))
+    
+    print(f"\n割り当て台帳: 維持 {kept:,}件, 復活 {revived:,}件, 新規 {len(new_sequences):,}件"
+          f"（うち衝突で移動 {len(collisions):,}件）, 廃止 {len(retired):,}件")
+    return stable_map
+
+def _save_catalog_meta(catalog_file, meta):
+    from mj_catalog import connect_catalog
+    
+    conn = connect_catalog(catalog_file)
+    try:
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", meta.items())
+    finally:
+        conn.close()
+
+def _save_catalog_allocations(pua_allocation_map, catalog_file, meta=None):
+    from mj_catalog import connect_catalog, write_pua_allocations
+    
+    conn = connect_catalog(catalog_file)
+    try:
+        updated, removed = write_pua_allocations(conn, pua_allocation_map, meta)
+    finally:
+        conn.close()
+    print(f"✓ PUA配置をカタログに保存: {catalog_file} (更新 {updated:,}件, 削除 {removed:,}件)")
+
+def save_staged_pua_mapping(pua_allocation_map, output_file=DEFAULT_STAGED_PUA_FILE,
+                            catalog_file=None, profile=None, source_hash=None, ledger_hash=None,
+                            ingest_revision=None, settings_hash=None):
+    """段階的PUAマッピングをJSONファイルに保存
+
+    profile は json_io の出力プロファイル（既定は compact）です。
+    catalog_file を指定すると mj_catalog のSQLiteカタログにも配置を書き込みます。
+    source_hash / ledger_hash は load_staged_pua_mapping() が再利用の判定に使います
+    （カタログには meta テーブルの pua_source_hash / pua_ledger_hash として保存）。
+    ingest_revision / settings_hash は配置したカタログの取り込み番号と設定のハッシュで、
+    カタログにだけ保存します（allocation_token() 参照）。
+    """
+    from json_io import write_json
     
     try:
         # 統計情報を計算
         bmp_count = len([x for x in pua_allocation_map.values() if x['pua_plane'] == 'BMP'])
         smp_count = len([x for x in pua_allocation_map.values() if x['pua_plane'] == 'SMP_P15'])
+        p16_count = len([x for x in pua_allocation_map.values() if x['pua_plane'] == 'SMP_P16'])
         
         output_data = {
             "mapping_strategy": "staged_pua_allocation",
@@ -193,16 +1117,27 @@ def save_staged_pua_mapping(pua_allocation_map, output_file="staged_pua_mappings
                 "total_characters": len(pua_allocation_map),
                 "bmp_pua_characters": bmp_count,
                 "smp_pua_characters": smp_count,
+                "smp_p16_pua_characters": p16_count,
                 "bmp_pua_range": "0xE000-0xF8FF",
-                "smp_pua_range": "0xF0000-0xFFFFD"
+                "smp_pua_range": "0xF0000-0xFFFFD",
+                "smp_p16_pua_range": "0x100000-0x10FFFD"
             },
             "mappings": pua_allocation_map
         }
+        if source_hash is not None:
+            output_data["source_hash"] = source_hash
+            output_data["ledger_hash"] = ledger_hash
         
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, ensure_ascii=False, indent=2)
+        write_json(output_data, output_file, profile)
         
         print(f"\n✓ 段階的PUAマッピングを保存: {output_file}")
+        
+        if catalog_file:
+            meta = None
+            if source_hash is not None:
+                meta = {"pua_source_hash": source_hash, "pua_ledger_hash": ledger_hash,
+                        "pua_ingest_revision": ingest_revision, "pua_settings_hash": settings_hash}
+            _save_catalog_allocations(pua_allocation_map, catalog_file, meta)
         return True
         
     except Exception as e:
@@ -210,13 +1145,73 @@ def save_staged_pua_mapping(pua_allocation_map, output_file="staged_pua_mappings
         return False
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="段階的PUA配置戦略分析")
+    parser.add_argument("--corpus", nargs="+", metavar="PATH",
+                        help="本番文書のファイル・ディレクトリ。IVSの出現頻度で配置した場合の見込みサイズを報告")
+    parser.add_argument("--extra", type=int, default=0, metavar="N",
+                        help="IVS以外に割り当てる文字数（MJ文字図形全体や自社外字など）を容量計画に加える")
+    parser.add_argument("--extra-plane", choices=[plane for plane, _, _ in PUA_PLANES], default='SMP_P15',
+                        help="--extra の文字を割り当て始める平面")
+    parser.add_argument("--reserved", default=DEFAULT_RESERVED_FILE,
+                        help="割り当てに使わない予約範囲のJSONファイル")
+    parser.add_argument("--shards", action="store_true",
+                        help="配置方式ごとに1文書が必要とするフォントシャード数を比較（--corpus がなければ基底文字ごとの異体字一式を1文書とみなす）")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+                        help="シャード1つ分のコードポイント数")
+    args = parser.parse_args()
+    
     print("段階的PUA配置戦略分析")
     print("=" * 50)
     
+    from ivs_records import load_ivs_records
+    
+    ivs_characters = ivs_characters_from_records(load_ivs_records())
+    
     # VS分布分析の実行
-    analysis = analyze_vs_distribution()
+    analysis = analyze_vs_distribution(ivs_characters)
     
     if analysis:
         print(f"\n✓ 分析完了: BMP PUA {analysis['bmp_used']:,}文字, SMP PUA {analysis['smp_used']:,}文字")
     else:
-        print("✗ 分析に失敗しました")
\ No newline at end of file
+        print("✗ 分析に失敗しました")
+    
+    reserved_ranges = load_reserved_ranges(args.reserved)
+    
+    # 容量計画（段階的配置の需要 + IVS以外の文字）
+    buckets = _bucket_by_vs(ivs_characters)
+    demand = Counter()
+    for vs_name, prefer_bmp in DEFAULT_VS_PLAN:
+        demand['BMP' if prefer_bmp else 'SMP_P15'] += len(buckets.get(vs_name, ()))
+    demand[args.extra_plane] += args.extra
+    
+    print(f"\n容量計画: IVS {len(ivs_characters):,}文字 + その他 {args.extra:,}文字")
+    try:
+        planner = plan_capacity(demand, reserved_ranges)
+    except PUACapacityError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    planner.print_report()
+    
+    if args.corpus:
+        frequencies = count_corpus_frequencies(args.corpus)
+        print(f"\nコーパス: {sum(frequencies.values()):,}回のIVS出現（{len(frequencies):,}種類）")
+        
+        # 比較の基準はビルドと同じ段階的配置（DEFAULT_VS_PLAN）
+        baseline = allocate_pua_codes(ivs_characters, DEFAULT_VS_PLAN, PUAPlanner(reserved_ranges))
+        candidate = frequency_allocation_map(ivs_characters, frequencies, PUAPlanner(reserved_ranges))
+        if baseline and candidate:
+            frequency_saving_report(frequencies, baseline, candidate)
+    
+    if args.shards:
+        policy_maps = {"staged": allocate_pua_codes(ivs_characters, planner=PUAPlanner(reserved_ranges))}
+        for cluster in CLUSTER_POLICIES:
+            policy_maps[cluster] = cluster_allocation_map(ivs_characters, cluster, PUAPlanner(reserved_ranges),
+                                                          args.shard_size)
+        if args.corpus:
+            policy_maps["frequency"] = frequency_allocation_map(ivs_characters, frequencies, PUAPlanner(reserved_ranges))
+            documents = corpus_documents(args.corpus)
+        else:
+            documents = family_documents(ivs_characters)
+        shard_touch_report(documents, policy_maps, args.shard_size)
\ No newline at end of file
@@ -1,32 +1,51 @@
 #!/usr/bin/env python3
-import json
+import os
+
+from json_io import load_json, write_json
+from mj_table import load_mj_table, DEFAULT_TABLE_FILE
+
+def reverse_entries(data):
+    """Return a copy of the parsed data with each C_values_with_F flipped to F -> C
+    
+    Used by reverse_c_f_mapping() and directly by parse_excel_with_f_column.py,
+    which writes the F -> C file without a JSON round-trip.
+    """
+    reversed_data = {}
+    for key, value in data.items():
+        if "C_values_with_F" in value:
+            # Reverse the key-value pairs
+            reversed_mapping = {}
+            for c_value, f_value in value["C_values_with_F"].items():
+                reversed_mapping[f_value] = c_value
+            
+            value = dict(value, C_values_with_F=reversed_mapping)
+        reversed_data[key] = value
+    return reversed_data
+
+def load_parsed_entries(input_file):
+    """Read parsed entries from a C -> F JSON file or the MJTable pickle"""
+    if input_file.endswith(".pickle"):
+        return load_mj_table(input_file)
+    return load_json(input_file)
 
 def reverse_c_f_mapping(input_file, output_file):
-    """Reverse the C_values_with_F mapping so F values become keys and C values become values"""
+    """Reverse the C_values_with_F mapping so F values become keys and C values become values
+    
+    input_file is the C -> F JSON or, as written by parse_excel_with_f_column.py
+    by default, the columnar MJTable pickle.
+    """
     
     try:
-        # Read the input JSON file
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # Read the parsed entries
+        data = load_parsed_entries(input_file)
         
         print(f"Loaded {len(data)} entries from {input_file}")
         
         # Reverse the mapping in each entry
-        for key, value in data.items():
-            if "C_values_with_F" in value:
-                # Reverse the key-value pairs
-                original_mapping = value["C_values_with_F"]
-                reversed_mapping = {}
-                
-                for c_value, f_value in original_mapping.items():
-                    reversed_mapping[f_value] = c_value
-                
-                # Update the mapping
-                value["C_values_with_F"] = reversed_mapping
+        data = reverse_entries(data)
         
         # Save the modified data
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        write_json(data, output_file)
         
         print(f"Reversed mapping saved to {output_file}")
         
@@ -47,6 +66,9 @@ def reverse_c_f_mapping(input_file, output_file):
 
 if __name__ == "__main__":
     input_file = "../mji_analysis_with_f_column.json"
+    if not os.path.exists(input_file):
+        # The C -> F JSON is only written on request; the table holds the same entries
+        input_file = DEFAULT_TABLE_FILE
     output_file = "../mji_analysis_f_to_c_mapping.json"
     
     result = reverse_c_f_mapping(input_file, output_file)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+中間ファイルの整合性チェック
+
+各ファイルを1回ずつ順に読み、ハッシュ集合で次の問題を数えます。
+
+    F列の衝突      同じF列の値（IVS）を複数のMJ文字図形名が持っている
+                   （reverse_c_f_mapping で後の行が前の行を上書きする）
+    消えたMJ名     C→F にIVSがあるのに F→C に残っていないMJ文字図形名
+    孤立したMJ名   F→C やJSマッピングにあるが C→F にないMJ文字図形名
+    不正なF列      'XXXX_E01XX' として解釈できないF列の値
+    IVSの重複      JSマッピングで同じIVSシーケンスが複数回定義されている
+    PUAの重複      同じPUAコードが複数のIVSシーケンスに割り当てられている
+    台帳との不一致  JSマッピング・段階的PUAマッピングのIVSが割り当て台帳にない、
+                   または台帳の active なコードと異なる（台帳のキーの誤りなど）
+
+存在しないファイルのチェックは省略します。問題があれば終了コード 1 で終わります。
+F→Cマッピングは f_to_c_index.LazyFToCMapping でエントリを1件ずつデコードし、
+全体をメモリに読み込みません（gzip / zstd のJSONは全体を読み込みます）。
+"""
+import os
+import re
+import sys
+import argparse
+from collections import Counter
+
+from json_io import load_json
+from f_to_c_index import LazyFToCMapping
+from pua_allocation_strategy_staged import ledger_key, DEFAULT_LEDGER_FILE
+
+# ivsCharacterMap.js の1行: '\u3404\uDB40\uDD02': '\uE000',  // MJ068055
+_JS_MAPPING_LINE = re.compile(
+    r"^\s*'((?:\\u[0-9A-Fa-f]{4})+)':\s*'((?:\\u[0-9A-Fa-f]{4})+)',\s*//\s*(\S+)")
+_JS_ESCAPE = re.compile(r'\\u([0-9A-Fa-f]{4})')
+
+EXAMPLE_LIMIT = 5
+
+# 既定のパスは scripts/ からの相対パス（リポジトリのルートからでも実行できるように）
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _default_path(path):
+    return os.path.relpath(os.path.join(SCRIPTS_DIR, path))
+
+def _decode_escaped(escaped):
+    """'\\uDB80\\uDC00' のようなUTF-16エスケープを文字列に戻す"""
+    units = "".join(chr(int(unit, 16)) for unit in _JS_ESCAPE.findall(escaped))
+    return units.encode('utf-16-le', 'surrogatepass').decode('utf-16-le')
+
+def _is_valid_f(f_value):
+    parts = f_value.split('_')
+    if len(parts) != 2 or not parts[1].startswith('E01'):
+        return False
+    try:
+        int(parts[0], 16)
+        int(parts[1][3:], 16)
+    except ValueError:
+        return False
+    return True
+
+class Report:
+    """チェック名ごとの件数と例"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.examples = {}
+        self.checked = []
+
+    def add(self, check, example):
+        self.counts[check] += 1
+        examples = self.examples.setdefault(check, [])
+        if len(examples) < EXAMPLE_LIMIT:
+            examples.append(example)
+
+    def print_summary(self):
+        print(f"チェックしたファイル: {', '.join(self.checked) if self.checked else 'なし'}")
+        for check in ("F列の衝突", "消えたMJ名", "孤立したMJ名", "不正なF列", "IVSの重複", "PUAの重複",
+                      "台帳との不一致"):
+            count = self.counts[check]
+            mark = "✓" if count == 0 else "✗"
+            print(f"{mark} {check}: {count:,}件")
+            for example in self.examples.get(check, []):
+                print(f"    {example}")
+
+    @property
+    def ok(self):
+        return not any(self.counts.values())
+
+def verify(c_to_f_file, f_to_c_file, js_map_file, staged_pua_file, ledger_file=DEFAULT_LEDGER_FILE):
+    report = Report()
+    ledger = None
+    if ledger_file and os.path.exists(ledger_file):
+        report.checked.append(ledger_file)
+        ledger = load_json(ledger_file)["active"]
+
+    def check_ledger(ivs_sequence, pua_code, source):
+        if ledger is None:
+            return
+        key = ledger_key(ivs_sequence)
+        if ledger.get(key) != pua_code:
+            report.add("台帳との不一致", f"{key}: U+{pua_code:04X} / 台帳 "
+                       f"{'なし' if key not in ledger else f'U+{ledger[key]:04X}'} ({source})")
+
+    known_mj = set()
+    ivs_mj = set()
+    referenced_mj = set()
+    mj_with_ivs = []
+
+    # C→F: F列の衝突と不正なF列
+    if os.path.exists(c_to_f_file):
+        report.checked.append(c_to_f_file)
+        owner_by_f = {}
+        for c_value, f_value in load_json(c_to_f_file).items():
+            known_mj.add(c_value)
+            if not f_value:
+                continue
+            if not _is_valid_f(f_value):
+                report.add("不正なF列", f"{c_value}: {f_value!r}")
+                continue
+            mj_with_ivs.append(c_value)
+            owner = owner_by_f.setdefault(f_value, c_value)
+            if owner != c_value:
+                report.add("F列の衝突", f"{f_value}: {owner} / {c_value}")
+
+    # F→C: 生成スクリプトが使うMJ名
+    if os.path.exists(f_to_c_file):
+        report.checked.append(f_to_c_file)
+        with LazyFToCMapping(f_to_c_file) as f_to_c:
+            for entry in f_to_c.values():
+                for f_value, c_value in entry.get("C_values_with_F", {}).items():
+                    if _is_valid_f(f_value):
+                        ivs_mj.add(c_value)
+        referenced_mj |= ivs_mj
+        if known_mj:
+            for c_value in mj_with_ivs:
+                if c_value not in ivs_mj:
+                    report.add("消えたMJ名", c_value)
+
+    # JSマッピング: IVS・PUAの重複
+    pua_owner = {}
+    if os.path.exists(js_map_file):
+        report.checked.append(js_map_file)
+        seen_ivs = set()
+        with open(js_map_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                match = _JS_MAPPING_LINE.match(line)
+                if not match:
+                    continue
+                ivs_escaped, pua_escaped, mj_name = match.groups()
+                referenced_mj.add(mj_name)
+                if ivs_escaped in seen_ivs:
+                    report.add("IVSの重複", f"{ivs_escaped} ({js_map_file}:{line_number})")
+                seen_ivs.add(ivs_escaped)
+                pua_code = ord(_decode_escaped(pua_escaped))
+                check_ledger(_decode_escaped(ivs_escaped), pua_code, f"{js_map_file}:{line_number}")
+                owner = pua_owner.setdefault(pua_code, ivs_escaped)
+                if owner != ivs_escaped:
+                    report.add("PUAの重複", f"U+{pua_code:04X}: {owner} / {ivs_escaped}")
+
+    # 段階的PUAマッピング: PUAの重複
+    if os.path.exists(staged_pua_file):
+        report.checked.append(staged_pua_file)
+        staged_owner = {}
+        for ivs_sequence, info in load_json(staged_pua_file).get("mappings", {}).items():
+            check_ledger(ivs_sequence, info['pua_code'], staged_pua_file)
+            owner = staged_owner.setdefault(info['pua_code'], ivs_sequence)
+            if owner != ivs_sequence:
+                report.add("PUAの重複", f"U+{info['pua_code']:04X}: {owner!r} / {ivs_sequence!r} ({staged_pua_file})")
+
+    if known_mj:
+        for mj_name in referenced_mj - known_mj:
+            report.add("孤立したMJ名", mj_name)
+
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="中間ファイルの整合性チェック")
+    parser.add_argument("--c-to-f", default=_default_path("../c_to_f_mapping.json"))
+    parser.add_argument("--f-to-c", default=_default_path("../mji_analysis_f_to_c_mapping.json"))
+    parser.add_argument("--js-map", default=_default_path("../src/utils/ivsCharacterMap.js"))
+    parser.add_argument("--staged-pua", default=_default_path("staged_pua_mappings.json"))
+    parser.add_argument("--ledger", default=_default_path(DEFAULT_LEDGER_FILE),
+                        help="割り当て台帳（空文字列でチェックを省略）")
+    args = parser.parse_args()
+
+    print("中間ファイルの整合性チェック")
+    print("=" * 50)
+
+    report = verify(args.c_to_f, args.f_to_c, args.js_map, args.staged_pua, args.ledger)
+    report.print_summary()
+
+    if not report.ok:
+        sys.exit(1)
@@ -1,6 +1,7 @@
 // IVS文字マッピング定義（段階的PUA配置対応）
 // BMP PUA: 0xE000-0xF8FF (6,400文字) - 高頻度VS優先
 // SMP PUA: 0xF0000- (65,534文字) - 残りのVS
+// SMP PUA (16面): 0x100000- (65,534文字) - 15面に入りきらない文字
 
 export const ivsToExternalCharMap = {
   '\u3404\uDB40\uDD02': '\uE000',  // MJ068055
@@ -11380,5 +11381,10 @@ export const puaAllocationStats = {
         capacity: 65534,
         range: '0xF0000-0xF1361'
     },
+    smpP16PUA: {
+        allocated: 0,
+        capacity: 65534,
+        range: null
+    },
     totalCharacters: 11362
 };